@@ -21,26 +21,48 @@
 import os
 import sys
 import json
+import threading
+import time
+import uuid
 import boto3
-import joblib
 import requests
 import numpy as np
-from flask import Flask, jsonify, request
+from collections import Counter
+from flask import Flask, Response, jsonify, request
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 docker_root = os.path.abspath(os.path.join(current_dir, '..'))
 sys.path.insert(0, docker_root)
 
 from endpoint_stuff.handle_data import HandleData
+from source.constants import Constants
+from source.inference.model_registry import ModelRegistry
+from source.preprocessing.activity_count.activity_count_service import ActivityCountService
 from source.preprocessing.preprocessing_runner import PreprocessingRunner
+from source.preprocessing.stage_cache import StageCache
+from source.tracing.memory_profiler import MemoryProfiler
+from source.tracing.sampling_profiler import SamplingProfiler
 
 app = Flask(__name__)
 
 s3 = boto3.client("s3")
 bucket_name = 's3-smart-alarm-app'
 
-model_path = "saved_model/Random_Forest.joblib"
-clf = joblib.load(model_path)
+# MODEL_PATH is one artifact, a directory of versions or an s3://bucket/prefix of them; with MODEL_REFRESH_SECONDS
+# set, the directory or prefix is polled and a new CURRENT version is swapped in without a redeploy
+model_registry = ModelRegistry(os.getenv("MODEL_PATH", "saved_model/Random_Forest.joblib"), HandleData.FEATURE_COLUMNS,
+                               s3=s3)
+model_registry.refresh()
+model_refresh_seconds = float(os.getenv("MODEL_REFRESH_SECONDS", "0"))
+if model_refresh_seconds > 0:
+    model_registry.start_polling(model_refresh_seconds)
+pipeline_lock = threading.Lock()
+profiling_lock = threading.Lock()
+memory_profile_dir = os.path.join('outputs', 'memory_profiles')
+
+admin_token = os.getenv("ADMIN_TOKEN")
+profiled_jobs = {'remaining': 0, 'interval': SamplingProfiler.DEFAULT_INTERVAL_IN_SECONDS, 'results': []}
+profiled_jobs_lock = threading.Lock()
 
 @app.route('/hello')
 def hello_world():
@@ -48,6 +70,22 @@ def hello_world():
 
 @app.route('/s3-webhook', methods=['POST'], strict_slashes=False)
 def s3_webhook():
+    if not Constants.MEMORY_PROFILING:
+        return handle_webhook()
+
+    # tracemalloc peaks are process-wide, so profiled requests run one at a time
+    with profiling_lock:
+        MemoryProfiler.start()
+        try:
+            with MemoryProfiler.stage('s3_webhook'):
+                return handle_webhook()
+        finally:
+            memory_profile = MemoryProfiler.stop()
+            os.makedirs(memory_profile_dir, exist_ok=True)
+            report_name = time.strftime('%Y%m%d_%H%M%S') + '_' + uuid.uuid4().hex[:8] + '.json'
+            memory_profile.write_json(os.path.join(memory_profile_dir, report_name))
+
+def handle_webhook():
     # SNS sends JSON data in the request body
     try:
         data = json.loads(request.data)
@@ -99,28 +137,162 @@ def s3_webhook():
                 local_dir = os.path.dirname(local_path)
                 os.makedirs(local_dir, exist_ok=True)
                 
-                s3.download_file(bucket_name, object_key, local_path)
+                with MemoryProfiler.stage('download', key=object_key):
+                    s3.download_file(bucket_name, object_key, local_path)
                 print(f"Downloaded {object_key} to {local_path}")
                 
                 dir_name = os.path.dirname(local_path)
-                HandleData.concat_npy_files(dir_name)
+                with MemoryProfiler.stage('concat_npy_files', directory=dir_name):
+                    HandleData.concat_npy_files(dir_name)
                 
                 # Add the parent session directory to the set of sessions to check
                 sessions_to_process.add(os.path.dirname(dir_name))
 
             for session_dir in sessions_to_process:
-                if HandleData.is_session_ready(session_dir):
-                    print(f"Session {session_dir} is ready. Running preprocessing...")
-                    PreprocessingRunner.run_preprocessing('0721', session_dir)
-                    feature_df = HandleData.load_files_into_df(session_dir)
-                    # feature_df.to_csv('test.csv')
-                    predictions = HandleData.make_predictions(feature_df, clf, session_dir)
-                    HandleData.upload_predictions_to_s3(predictions, bucket_name, object_key, s3)
-                    HandleData.delete_user_data_if_is_last(session_dir)
+                if not HandleData.is_session_ready(session_dir):
+                    continue
+
+                # The pipeline keeps its output paths in process-wide Constants, so sessions run one at a time
+                with pipeline_lock:
+                    profiler = claim_profiled_job()
+                    if profiler is None:
+                        process_session(session_dir, bucket_name, object_key)
+                    else:
+                        with profiler:
+                            process_session(session_dir, bucket_name, object_key)
+                        store_profiled_job(session_dir, profiler)
         
         return "Notification received", 200
 
     return "OK", 200
 
+def process_session(session_dir, bucket_name, object_key, upload=True):
+    print(f"Session {session_dir} is ready. Running preprocessing...")
+    PreprocessingRunner.run_preprocessing('0721', session_dir)
+
+    # The job keeps this model even if another version is swapped in while it runs
+    model_version, model, model_path = model_registry.get_model(session_dir)
+    print(f"Predicting {session_dir} with model {model_version}")
+
+    if not upload:
+        feature_df = HandleData.load_files_into_df(session_dir)
+        return HandleData.make_predictions(feature_df, model, session_dir)[0]
+
+    stage_cache = StageCache(StageCache.get_manifest_path(session_dir, '0721'))
+    prediction_key = HandleData.get_prediction_key(stage_cache, session_dir, model_path, model.classes_)
+    if stage_cache.is_current(StageCache.PREDICTIONS, prediction_key):
+        print(f"Predictions for {session_dir} are up to date, skipping upload")
+    else:
+        with MemoryProfiler.stage('load_files_into_df'):
+            feature_df = HandleData.load_files_into_df(session_dir)
+        # feature_df.to_csv('test.csv')
+        with MemoryProfiler.stage('make_predictions', epochs=len(feature_df)):
+            predictions, probabilities = HandleData.make_predictions(feature_df, model, session_dir)
+        with MemoryProfiler.stage('upload_predictions'):
+            start_seconds = 0 if feature_df.empty else float(feature_df['time_feature'].iloc[0]) * 3600
+            is_uploaded = HandleData.upload_predictions_to_s3(predictions, probabilities, model.classes_, bucket_name,
+                                                               object_key, s3, session_dir, model_version,
+                                                               round(start_seconds, 3))
+        if is_uploaded:
+            stage_cache.record(StageCache.PREDICTIONS, prediction_key)
+    HandleData.delete_user_data_if_is_last(session_dir)
+
+def is_admin_request():
+    # The admin routes stay disabled unless the container is given a token to check against
+    return admin_token is not None and request.headers.get('X-Admin-Token') == admin_token
+
+def claim_profiled_job():
+    with profiled_jobs_lock:
+        if profiled_jobs['remaining'] == 0:
+            return None
+        profiled_jobs['remaining'] -= 1
+        return SamplingProfiler(profiled_jobs['interval'])
+
+def store_profiled_job(session_dir, profiler):
+    with profiled_jobs_lock:
+        profiled_jobs['results'].append({'session': session_dir,
+                                         'seconds': profiler.elapsed_seconds,
+                                         'samples': profiler.sample_count,
+                                         'collapsed': profiler.get_collapsed()})
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    if not is_admin_request():
+        return "Forbidden", 403
+
+    body = request.get_json(silent=True) or {}
+    interval = float(body.get('interval', SamplingProfiler.DEFAULT_INTERVAL_IN_SECONDS))
+
+    if 'next_jobs' in body:
+        with profiled_jobs_lock:
+            profiled_jobs['remaining'] = int(body['next_jobs'])
+            profiled_jobs['interval'] = interval
+        return jsonify(armed=profiled_jobs['remaining'])
+
+    session_dir = body.get('session')
+    if session_dir is None:
+        return "Expected 'session' or 'next_jobs'", 400
+
+    user_data_dir = os.path.realpath(os.path.join('data', 'user_data'))
+    if not os.path.realpath(session_dir).startswith(user_data_dir + os.sep):
+        return "Session must be under data/user_data", 400
+    if not HandleData.is_session_ready(session_dir):
+        return "Session is not ready", 404
+
+    # Every stage is rerun so the profile covers the whole pipeline; predictions are not uploaded. The saved count
+    # state goes too, or the counts stage would find no new samples and skip the counting.
+    with pipeline_lock:
+        skip_unchanged_stages = Constants.SKIP_UNCHANGED_STAGES
+        Constants.update('SKIP_UNCHANGED_STAGES', False)
+        try:
+            ActivityCountService.remove_state('0721', session_dir)
+            with SamplingProfiler(interval) as profiler:
+                process_session(session_dir, None, None, upload=False)
+        finally:
+            Constants.update('SKIP_UNCHANGED_STAGES', skip_unchanged_stages)
+
+    return Response(profiler.get_collapsed(), mimetype='text/plain')
+
+@app.route('/admin/models', methods=['GET', 'POST'])
+def admin_models():
+    if not is_admin_request():
+        return "Forbidden", 403
+
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        try:
+            if body.get('refresh'):
+                model_registry.refresh()
+            if 'activate' in body:
+                model_registry.activate(body['activate'])
+            if 'canary' in body:
+                model_registry.set_canary(body['canary'], float(body.get('fraction', 0.1)))
+        except (KeyError, FileNotFoundError, ValueError) as e:
+            return jsonify(error=str(e)), 400
+
+    return jsonify(model_registry.get_status())
+
+@app.route('/admin/profile/results', methods=['GET'])
+def admin_profile_results():
+    if not is_admin_request():
+        return "Forbidden", 403
+
+    with profiled_jobs_lock:
+        results = list(profiled_jobs['results'])
+        if request.args.get('clear'):
+            profiled_jobs['results'] = []
+
+    if request.args.get('format') == 'json':
+        return jsonify(remaining=profiled_jobs['remaining'], jobs=results)
+
+    # Stacks from every stored job, merged so one flamegraph covers them all
+    merged = Counter()
+    for result in results:
+        for line in result['collapsed'].splitlines():
+            stack, count = line.rsplit(' ', 1)
+            merged[stack] += int(count)
+    return Response(''.join(stack + ' ' + str(count) + '\n' for stack, count in sorted(merged.items())),
+                    mimetype='text/plain')
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
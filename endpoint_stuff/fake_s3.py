@@ -0,0 +1,68 @@
+import io
+import os
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+
+class NoSuchKey(Exception):
+    pass
+
+
+class FakeS3:
+    # Filesystem stand-in for the parts of the boto3 S3 client the webhook uses. Objects live at
+    # <root>/<bucket>/<key>, and every put is logged with its time so a load test can match uploads to requests.
+    def __init__(self, root):
+        self.root = root
+        self.uploads = []
+        self.lock = threading.Lock()
+        self.exceptions = SimpleNamespace(NoSuchKey=NoSuchKey)
+
+    def get_path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def download_file(self, Bucket, Key, Filename):
+        source_path = self.get_path(Bucket, Key)
+        if not os.path.exists(source_path):
+            raise FileNotFoundError(f"s3://{Bucket}/{Key} does not exist")
+        shutil.copyfile(source_path, Filename)
+
+    def get_object(self, Bucket, Key):
+        source_path = self.get_path(Bucket, Key)
+        if not os.path.exists(source_path):
+            raise NoSuchKey(f"s3://{Bucket}/{Key} does not exist")
+        with open(source_path, 'rb') as file:
+            return {'Body': io.BytesIO(file.read())}
+
+    def list_objects_v2(self, Bucket, Prefix='', ContinuationToken=None):
+        bucket_path = os.path.join(self.root, Bucket)
+        keys = []
+        for directory, _, file_names in os.walk(bucket_path):
+            for file_name in file_names:
+                key = os.path.relpath(os.path.join(directory, file_name), bucket_path).replace(os.sep, '/')
+                if key.startswith(Prefix):
+                    keys.append(key)
+        return {'Contents': [{'Key': key} for key in sorted(keys)], 'IsTruncated': False}
+
+    def upload_file(self, Filename, Bucket, Key):
+        destination_path = self.get_path(Bucket, Key)
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        shutil.copyfile(Filename, destination_path)
+        self.log_upload(Bucket, Key)
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        destination_path = self.get_path(Bucket, Key)
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        with open(destination_path, 'wb') as file:
+            file.write(Body.encode('utf-8') if isinstance(Body, str) else Body)
+        self.log_upload(Bucket, Key)
+        return {}
+
+    def log_upload(self, bucket, key):
+        with self.lock:
+            self.uploads.append((time.perf_counter(), bucket, key))
+
+    def get_uploads_since(self, start_time, key_prefix=''):
+        with self.lock:
+            return [upload for upload in self.uploads if upload[0] >= start_time and upload[2].startswith(key_prefix)]
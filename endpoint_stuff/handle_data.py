@@ -2,10 +2,21 @@ import numpy as np
 import pandas as pd
 import json
 import shutil
-from sklearn.preprocessing import StandardScaler
 import os
 
+from source.constants import Constants
+from source.inference.prediction_packet import PredictionPacket
+from source.inference.threshold_decoder import ThresholdDecoder
+from source.preprocessing.feature_store import FeatureStore
+from source.preprocessing.stage_cache import StageCache
+
+
 class HandleData:
+    # Columns of load_files_into_df, in order; models are checked against them before they serve
+    FEATURE_COLUMNS = ['cosine_feature', 'count_feature', 'hr_std', 'hr_mean', 'time_feature',
+                       'count_feature_lag_1', 'count_feature_lag_2', 'hr_std_lag_1', 'hr_std_lag_2',
+                       'hr_mean_lag_1', 'hr_mean_lag_2', 'hr_mean_delta']
+
     @staticmethod
     def concat_npy_files(dir_path):
         file_name = ''
@@ -23,7 +34,8 @@ class HandleData:
         data_list = [np.load(os.path.join(dir_path, f)) for f in files]
         concatenated_data = np.concatenate(data_list, axis=0)
         
-        np.save(os.path.join(dir_path, file_name), concatenated_data)
+        # Stored column-major so loaders can memory-map single columns without reading the others
+        np.save(os.path.join(dir_path, file_name), np.asfortranarray(concatenated_data))
 
         if 'acceleration' in dir_path:
             timestamp = concatenated_data[-1][0]
@@ -76,20 +88,16 @@ class HandleData:
     
     @staticmethod
     def load_files_into_df(dir_path):
-        dir_path = os.path.join(dir_path, 'outputs', 'features')
-
-        cosine_feature = np.load(os.path.join(dir_path, '0721_cosine_feature.npy'))
-        count_feature = np.load(os.path.join(dir_path, '0721_count_feature.npy'))
-        hr_std_feature = np.load(os.path.join(dir_path, '0721_hr_feature.npy'))
-        hr_mean_feature = np.load(os.path.join(dir_path, '0721_hr_mean_feature.npy'))
-        time_feature = np.load(os.path.join(dir_path, '0721_time_feature.npy'))
+        features = FeatureStore.read(FeatureStore.get_path_for_session(dir_path, '0721'),
+                                     columns=[FeatureStore.COSINE, FeatureStore.COUNT, FeatureStore.HR_STD,
+                                              FeatureStore.HR_MEAN, FeatureStore.TIME])
 
         df = pd.DataFrame({
-            'cosine_feature': cosine_feature,
-            'count_feature': count_feature,
-            'hr_std': hr_std_feature,
-            'hr_mean': hr_mean_feature,
-            'time_feature': time_feature,
+            'cosine_feature': features[FeatureStore.COSINE],
+            'count_feature': features[FeatureStore.COUNT],
+            'hr_std': features[FeatureStore.HR_STD],
+            'hr_mean': features[FeatureStore.HR_MEAN],
+            'time_feature': features[FeatureStore.TIME],
         })
 
         df['count_feature_lag_1'] = df['count_feature'].shift(1)
@@ -105,6 +113,7 @@ class HandleData:
         df = df.iloc[2:].reset_index(drop=True)
 
         if not df.empty:
+            from sklearn.preprocessing import StandardScaler
             scaler = StandardScaler()
             df['hr_mean_delta'] = scaler.fit_transform(df[['hr_mean_delta']])
 
@@ -112,31 +121,50 @@ class HandleData:
     
     @staticmethod
     def make_predictions(feature_df, model, session_dir):
+        # Probabilities are computed once; labels are decoded from them with the serving thresholds
         if feature_df.empty:
-            return np.array([])
+            return np.array([]), np.zeros((0, len(model.classes_)))
 
-        predictions = model.predict(feature_df)
+        probabilities = model.predict_proba(feature_df)
+        predictions = ThresholdDecoder.decode(probabilities, model.classes_)
         # np.savetxt('predictions.out', predictions, fmt='%d')
 
         save_path = os.path.join(session_dir, 'outputs', 'predictions')
         os.makedirs(save_path, exist_ok=True)
         # np.save(os.path.join(save_path, '0721_predictions.npy'), predictions)
 
-        return predictions
+        return predictions, probabilities
 
     @staticmethod
-    def upload_predictions_to_s3(predictions, bucket_name, dir_path, s3):
+    def upload_predictions_to_s3(predictions, probabilities, classes, bucket_name, dir_path, s3, session_dir=None,
+                                 model_version=None, start_seconds=0):
         if predictions.size == 0:
-            return  
+            return False
         
         # Ensure we use forward slashes for S3 keys regardless of OS
         parts = dir_path.replace('\\', '/').split('/')
         if len(parts) >= 3:
             # Get the session directory (e.g., users/0001/20260102_142813)
             session_prefix = '/'.join(parts[:3])
+            if Constants.PREDICTION_UPLOAD_FORMAT == 'binary':
+                return HandleData.upload_prediction_packet(predictions, probabilities, classes, bucket_name,
+                                                           session_prefix, s3, session_dir, model_version,
+                                                           start_seconds)
+
             prediction_key = f"{session_prefix}/predictions/0721_predictions.json"
-            
+            probability_key = f"{session_prefix}/predictions/0721_probabilities.json"
+
+            # Probabilities go up first, so a client that sees new labels can already fetch them to re-threshold
+            probability_body = {'classes': np.asarray(classes).tolist(),
+                                'thresholds': ThresholdDecoder.get_serving_thresholds(classes),
+                                'probabilities': np.asarray(probabilities).tolist()}
             try:
+                s3.put_object(
+                    Bucket=bucket_name,
+                    Key=probability_key,
+                    Body=json.dumps(probability_body),
+                    ContentType='application/json'
+                )
                 s3.put_object(
                     Bucket=bucket_name,
                     Key=prediction_key,
@@ -144,9 +172,76 @@ class HandleData:
                     ContentType='application/json'
                 )
                 print(f"Uploaded predictions to s3://{bucket_name}/{prediction_key}")
+                return True
             except Exception as e:
                 print(f"Failed to upload predictions: {e}")
+        return False
         
+    @staticmethod
+    def upload_prediction_packet(predictions, probabilities, classes, bucket_name, session_prefix, s3, session_dir,
+                                 model_version, start_seconds):
+        # The labels and quantized probabilities last uploaded are kept with the session, so a delta can be worked
+        # out against them and the sequence numbers continue across runs
+        state_path = None
+        previous_state = None
+        if session_dir is not None:
+            state_path = os.path.join(session_dir, 'outputs', 'predictions', '0721_upload_state.npz')
+            if os.path.exists(state_path):
+                previous_state = dict(np.load(state_path))
+
+        sequence = 0 if previous_state is None else int(previous_state['sequence']) + 1
+        if not Constants.PREDICTION_UPLOAD_PROBABILITIES:
+            probabilities = None
+        quantized = None if probabilities is None else PredictionPacket.quantize(probabilities)
+
+        header = {'sequence': sequence, 'model_version': model_version, 'start_seconds': start_seconds,
+                  'epoch_seconds': Constants.EPOCH_DURATION_IN_SECONDS, 'classes': np.asarray(classes).tolist(),
+                  'thresholds': ThresholdDecoder.get_serving_thresholds(classes)}
+        ranges = None
+        prediction_key = f"{session_prefix}/predictions/0721_predictions.bin"
+
+        is_snapshot = (previous_state is None or not Constants.PREDICTION_UPLOAD_DELTAS or
+                       sequence % Constants.PREDICTION_SNAPSHOT_INTERVAL == 0)
+        if not is_snapshot:
+            previous_quantized = previous_state.get('quantized') if quantized is not None else None
+            ranges = PredictionPacket.get_changed_ranges(predictions, quantized, previous_state['labels'],
+                                                         previous_quantized)
+            if not ranges and len(predictions) == len(previous_state['labels']):
+                print(f"Predictions for {session_prefix} did not change, nothing to upload")
+                return True
+            header['base_sequence'] = sequence - 1
+            prediction_key = f"{session_prefix}/predictions/0721_predictions_{sequence:05d}.delta"
+
+        packet = PredictionPacket.encode(predictions, probabilities, header, ranges)
+        try:
+            s3.put_object(
+                Bucket=bucket_name,
+                Key=prediction_key,
+                Body=packet,
+                ContentType='application/octet-stream'
+            )
+        except Exception as e:
+            print(f"Failed to upload predictions: {e}")
+            return False
+        print(f"Uploaded {len(packet)} bytes of predictions to s3://{bucket_name}/{prediction_key}")
+
+        if state_path is not None:
+            state = {'labels': predictions, 'sequence': sequence}
+            if quantized is not None:
+                state['quantized'] = quantized
+            os.makedirs(os.path.dirname(state_path), exist_ok=True)
+            np.savez(state_path, **state)
+        return True
+
+    @staticmethod
+    def get_prediction_key(stage_cache, session_dir, model_path, classes):
+        parameters = {'thresholds': ThresholdDecoder.get_serving_thresholds(classes),
+                      'format': Constants.PREDICTION_UPLOAD_FORMAT,
+                      'deltas': Constants.PREDICTION_UPLOAD_DELTAS,
+                      'probabilities': Constants.PREDICTION_UPLOAD_PROBABILITIES}
+        return stage_cache.get_key(StageCache.PREDICTIONS,
+                                   [FeatureStore.get_path_for_session(session_dir, '0721'), model_path], parameters)
+
     @staticmethod
     def delete_user_data_if_is_last(dir_path):
         json_path = os.path.join(dir_path, 'is_last.json')
@@ -0,0 +1,184 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+docker_root = os.path.abspath(os.path.join(current_dir, '..'))
+sys.path.insert(0, docker_root)
+
+from endpoint_stuff.fake_s3 import FakeS3
+from source.benchmarks.synthetic_night_generator import SyntheticNightGenerator
+
+# Replays S3 upload notifications, wrapped the way SNS delivers them, against the webhook served by the same
+# threaded werkzeug server app.run uses. The app's S3 client is swapped for a FakeS3 rooted in a temp directory.
+# Run from the project root, as the container does, so the app's relative data/ paths resolve the same way.
+
+BUCKET = 's3-smart-alarm-app'
+RSS_SAMPLE_INTERVAL_IN_SECONDS = 0.05
+
+
+def make_notification(bucket, keys):
+    message = {'Records': [{'eventName': 'ObjectCreated:Put',
+                            'eventTime': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                            's3': {'bucket': {'name': bucket}, 'object': {'key': key}}} for key in keys]}
+    return {'Type': 'Notification',
+            'MessageId': str(uuid.uuid4()),
+            'TopicArn': 'arn:aws:sns:local:000000000000:load-test',
+            'Message': json.dumps(message)}
+
+
+def stage_sessions(fake_s3, number_of_sessions, hours, run_id, work_dir):
+    # One synthetic night is generated and its chunk files are copied under each session prefix
+    night_dir = SyntheticNightGenerator.generate(os.path.join(work_dir, 'night'), hours=hours)
+    uploads = []
+
+    for session_index in range(number_of_sessions):
+        prefix = 'users/' + run_id + '-' + str(session_index) + '/session'
+        session_keys = []
+        for sensor in ['acceleration', 'heartrate']:
+            chunk_names = sorted(name for name in os.listdir(os.path.join(night_dir, sensor)) if '_chunk_' in name)
+            for chunk_name in chunk_names:
+                key = prefix + '/' + sensor + '/' + chunk_name
+                destination = fake_s3.get_path(BUCKET, key)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.copyfile(os.path.join(night_dir, sensor, chunk_name), destination)
+                session_keys.append((chunk_name, key))
+
+        # Each notification carries the acceleration and heart rate chunk uploaded together
+        session_keys.sort()
+        notifications = [[key for name, key in session_keys if name == chunk_name]
+                         for chunk_name in sorted(set(name for name, _ in session_keys))]
+        uploads.append((prefix, notifications))
+
+    return uploads
+
+
+def replay_session(url, fake_s3, prefix, notifications):
+    results = []
+    for keys in notifications:
+        send_time = time.perf_counter()
+        response = requests.post(url, data=json.dumps(make_notification(BUCKET, keys)),
+                                 headers={'x-amz-sns-message-type': 'Notification'})
+        response_time = time.perf_counter()
+
+        uploads = fake_s3.get_uploads_since(send_time, prefix + '/predictions/')
+        results.append({'status': response.status_code,
+                        'response_seconds': response_time - send_time,
+                        'upload_seconds': uploads[0][0] - send_time if uploads else None})
+    return results
+
+
+class RssSampler(object):
+    def __init__(self):
+        self.peak = 0
+        self.running = False
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    @staticmethod
+    def get_rss():
+        try:
+            with open('/proc/self/statm') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, RssSampler.get_rss())
+            time.sleep(RSS_SAMPLE_INTERVAL_IN_SECONDS)
+
+    def __enter__(self):
+        self.running = True
+        self.thread.start()
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, RssSampler.get_rss())
+        return False
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {'count': len(values), 'p50': float(np.percentile(values, 50)), 'p90': float(np.percentile(values, 90)),
+            'p99': float(np.percentile(values, 99)), 'max': float(np.max(values))}
+
+
+def run_load_test(number_of_sessions, concurrency, hours, model_path, port):
+    os.environ['MODEL_PATH'] = model_path
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    from werkzeug.serving import make_server
+    import endpoint_stuff.endpoint as endpoint
+
+    run_id = 'loadtest-' + uuid.uuid4().hex[:8]
+    with tempfile.TemporaryDirectory() as work_dir:
+        fake_s3 = FakeS3(os.path.join(work_dir, 's3'))
+        endpoint.s3 = fake_s3
+
+        print(f"Staging {number_of_sessions} sessions of {hours} h...")
+        sessions = stage_sessions(fake_s3, number_of_sessions, hours, run_id, work_dir)
+
+        server = make_server('127.0.0.1', port, endpoint.app, threaded=True)
+        server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+        server_thread.start()
+        url = f"http://127.0.0.1:{server.server_port}/s3-webhook"
+
+        baseline_rss = RssSampler.get_rss()
+        try:
+            with RssSampler() as rss_sampler:
+                start_time = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    futures = [executor.submit(replay_session, url, fake_s3, prefix, notifications)
+                               for prefix, notifications in sessions]
+                    results = [result for future in futures for result in future.result()]
+                elapsed = time.perf_counter() - start_time
+        finally:
+            server.shutdown()
+            for session_index in range(number_of_sessions):
+                shutil.rmtree(os.path.join('data', 'user_data', run_id + '-' + str(session_index)), ignore_errors=True)
+
+    upload_latencies = [result['upload_seconds'] for result in results if result['upload_seconds'] is not None]
+    return {'sessions': number_of_sessions,
+            'concurrency': concurrency,
+            'hours': hours,
+            'notifications': len(results),
+            'failed_notifications': sum(1 for result in results if result['status'] != 200),
+            'uploads': len(upload_latencies),
+            'elapsed_seconds': elapsed,
+            'notifications_per_second': len(results) / elapsed,
+            'uploads_per_second': len(upload_latencies) / elapsed,
+            'response_seconds': summarize([result['response_seconds'] for result in results]),
+            'notification_to_upload_seconds': summarize(upload_latencies),
+            'baseline_rss_bytes': baseline_rss,
+            'peak_rss_bytes': rss_sampler.peak}
+
+
+if __name__ == '__main__':
+    # e.g. python endpoint_stuff/webhook_load_test.py --sessions 8 --concurrency 4 --model saved_model/Random_Forest.joblib
+    parser = argparse.ArgumentParser(description="Replay S3 notifications against the webhook with a fake S3.")
+    parser.add_argument('--sessions', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--hours', type=float, default=1.0, help="Length of each synthetic night")
+    parser.add_argument('--model', default='saved_model/Random_Forest.joblib')
+    parser.add_argument('--port', type=int, default=0, help="Port for the local server (default: any free port)")
+    parser.add_argument('--output', default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_load_test(args.sessions, args.concurrency, args.hours, args.model, args.port)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
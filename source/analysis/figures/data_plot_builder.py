@@ -91,9 +91,9 @@ class DataPlotBuilder(object):
                 max_time = sample_point + window_size
 
             ax = plt.subplot(num_v_plots, 1, 1)
-            ax.plot(motion[:, 0], motion[:, 1], color=motion_color)
-            ax.plot(motion[:, 0], motion[:, 2], color=[0.4, 0.2, 0.7])
-            ax.plot(motion[:, 0], motion[:, 3], color=[0.5, 0.2, 0.6])
+            motion_colors = [motion_color, [0.4, 0.2, 0.7], [0.5, 0.2, 0.6]]
+            for column in range(1, np.shape(motion)[1]):  # Cropped motion may hold only the z-axis
+                ax.plot(motion[:, 0], motion[:, column], color=motion_colors[column - 1])
             plt.ylabel('Motion (g)', fontsize=font_size, fontname=font_name)
             DataPlotBuilder.tidy_data_plot(min_time, max_time, dt, ax)
 
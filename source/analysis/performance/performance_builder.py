@@ -2,8 +2,9 @@ import numpy as np
 from sklearn.metrics import roc_curve, auc, cohen_kappa_score, accuracy_score, recall_score, precision_score
 
 from source.analysis.performance.epoch_performance import SleepWakePerformance
-from source.analysis.setup.sleep_label import SleepWakeLabel, ThreeClassLabel
+from source.analysis.setup.sleep_label import SleepWakeLabel
 from source.analysis.setup.sleep_labeler import SleepLabeler
+from source.inference.threshold_decoder import ThresholdDecoder
 
 
 class PerformanceBuilder(object):
@@ -58,29 +59,8 @@ class PerformanceBuilder(object):
 
     @staticmethod
     def apply_threshold_sleep_wake(raw_performance, sleep_threshold):
-        predicted_labels = []
-
-        number_of_samples = np.shape(raw_performance.class_probabilities)[0]
-        for index in range(number_of_samples):
-            if raw_performance.class_probabilities[index, 1] >= sleep_threshold:
-                predicted_labels.append(SleepWakeLabel.sleep.value)
-            else:
-                predicted_labels.append(SleepWakeLabel.wake.value)
-
-        return np.array(predicted_labels)
+        return ThresholdDecoder.decode_sleep_wake(raw_performance.class_probabilities, sleep_threshold)
 
     @staticmethod
     def apply_threshold_three_class(raw_performance, wake_threshold, rem_threshold):
-        predicted_labels = []
-
-        number_of_samples = np.shape(raw_performance.class_probabilities)[0]
-        for index in range(number_of_samples):
-            if raw_performance.class_probabilities[index, 0] >= wake_threshold:
-                predicted_labels.append(ThreeClassLabel.wake.value)
-            else:
-                if raw_performance.class_probabilities[index, 2] >= rem_threshold:
-                    predicted_labels.append(ThreeClassLabel.rem.value)
-                else:
-                    predicted_labels.append(ThreeClassLabel.nrem.value)
-
-        return np.array(predicted_labels)
+        return ThresholdDecoder.decode_three_class(raw_performance.class_probabilities, wake_threshold, rem_threshold)
@@ -1,7 +1,10 @@
+import numpy as np
+
 from source.analysis.setup.feature_type import FeatureType
 from source.analysis.setup.subject import Subject
 from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_feature_service import ActivityCountFeatureService
+from source.preprocessing.feature_store import FeatureStore
 from source.preprocessing.heart_rate.heart_rate_feature_service import HeartRateFeatureService
 from source.preprocessing.psg.psg_label_service import PSGLabelService
 from source.preprocessing.time.time_based_feature_service import TimeBasedFeatureService
@@ -34,15 +37,28 @@ class SubjectBuilder(object):
 
     @staticmethod
     def build(subject_id):
-        feature_count = ActivityCountFeatureService.load(subject_id)
-        feature_hr = HeartRateFeatureService.load(subject_id)
-        feature_time = TimeBasedFeatureService.load_time(subject_id)
-        if Constants.INCLUDE_CIRCADIAN:
-            feature_circadian = TimeBasedFeatureService.load_circadian_model(subject_id)
-        else:
-            feature_circadian = None
-        feature_cosine = TimeBasedFeatureService.load_cosine(subject_id)
-        labeled_sleep = PSGLabelService.load(subject_id)
+        feature_store_path = FeatureStore.get_path(subject_id)
+        if feature_store_path.is_file():
+            features = FeatureStore.read(feature_store_path)
+            feature_count = features[FeatureStore.COUNT]
+            feature_hr = features[FeatureStore.HR_STD]
+            feature_time = features[FeatureStore.TIME]
+            if Constants.INCLUDE_CIRCADIAN and FeatureStore.CIRCADIAN in features:
+                feature_circadian = np.expand_dims(features[FeatureStore.CIRCADIAN], axis=1)
+            else:
+                feature_circadian = None
+            feature_cosine = features[FeatureStore.COSINE]
+            labeled_sleep = features[FeatureStore.LABELS]
+        else:  # Features built before the consolidated store was introduced
+            feature_count = ActivityCountFeatureService.load(subject_id)
+            feature_hr = HeartRateFeatureService.load(subject_id)
+            feature_time = TimeBasedFeatureService.load_time(subject_id)
+            if Constants.INCLUDE_CIRCADIAN:
+                feature_circadian = TimeBasedFeatureService.load_circadian_model(subject_id)
+            else:
+                feature_circadian = None
+            feature_cosine = TimeBasedFeatureService.load_cosine(subject_id)
+            labeled_sleep = PSGLabelService.load(subject_id)
 
         feature_dictionary = {FeatureType.count: feature_count,
                               FeatureType.heart_rate: feature_hr,
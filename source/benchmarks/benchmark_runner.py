@@ -0,0 +1,157 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from endpoint_stuff.handle_data import HandleData
+from source import utils
+from source.benchmarks.synthetic_night_generator import SyntheticNightGenerator
+from source.constants import Constants
+from source.inference.forest_bundle import load_model
+from source.preprocessing.activity_count.activity_count_feature_service import ActivityCountFeatureService
+from source.preprocessing.activity_count.activity_count_service import ActivityCountService
+from source.preprocessing.grid_cache import GridCache
+from source.preprocessing.heart_rate.heart_rate_feature_service import HeartRateFeatureService
+from source.preprocessing.heart_rate.heart_rate_service import HeartRateService
+from source.preprocessing.motion.motion_service import MotionService
+from source.preprocessing.preprocessing_runner import PreprocessingRunner
+from source.preprocessing.psg.psg_label_service import PSGLabelService
+from source.preprocessing.raw_data_processor import RawDataProcessor
+from source.preprocessing.time.time_based_feature_service import TimeBasedFeatureService
+
+
+class BenchmarkRunner(object):
+    # Times each stage on synthetic nights, then repeats it once under tracemalloc for its peak allocation.
+    # Memory is measured on a separate run because tracing allocations slows the timed runs down.
+    DEFAULT_HOURS = [1, 8]
+    DEFAULT_REPEATS = 3
+    DEFAULT_MODEL_PATH = 'saved_model/Random_Forest.joblib'
+
+    @staticmethod
+    def run(hours_list, repeats, work_dir, model_path=None, seed=0):
+        Constants.update('VERBOSE', False)
+        Constants.update('SKIP_UNCHANGED_STAGES', False)
+
+        model = None
+        if model_path is not None and os.path.exists(model_path):
+            model = load_model(model_path)
+        else:
+            print(f"No model at {model_path}, skipping model.predict")
+
+        results = []
+        for hours in hours_list:
+            session_dir = os.path.join(work_dir, 'night_' + str(hours) + 'h')
+            print(f"Generating a {hours} h synthetic night in {session_dir}...")
+            SyntheticNightGenerator.generate(session_dir, hours=hours, seed=seed)
+
+            for name, function in BenchmarkRunner.get_benchmarks(session_dir, model):
+                result = BenchmarkRunner.measure(function, repeats)
+                result.update({'benchmark': name, 'hours': hours})
+                results.append(result)
+                print(f"  {name}: {result['wall_seconds_median'] * 1000:.1f} ms, "
+                      f"peak {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB")
+
+        return {'environment': BenchmarkRunner.get_environment(), 'repeats': repeats, 'seed': seed,
+                'results': results}
+
+    @staticmethod
+    def get_benchmarks(session_dir, model):
+        subject_id = SyntheticNightGenerator.SUBJECT_ID
+
+        # A full run first so the cropped files and feature store the later stages read from exist
+        PreprocessingRunner.run_preprocessing(subject_id, session_dir)
+
+        raw_motion = np.load(str(MotionService.get_raw_file_path(subject_id, session_dir)))
+        motion_data = np.asarray(MotionService.load_cropped(subject_id).data)
+        valid_epochs = RawDataProcessor.get_valid_epochs(subject_id)
+        count_collection = ActivityCountService.load_cropped(subject_id)
+        heart_rate_collection = HeartRateService.load_cropped(subject_id)
+
+        def run_preprocessing():
+            # Without this every repeat after the warm-up would find no new samples and skip the counts work
+            ActivityCountService.remove_state(subject_id, session_dir)
+            PreprocessingRunner.run_preprocessing(subject_id, session_dir)
+
+        def predict():
+            model.predict(HandleData.load_files_into_df(session_dir))
+
+        benchmarks = [
+            ('run_preprocessing', run_preprocessing),
+            ('remove_repeats', lambda: utils.remove_repeats(raw_motion)),
+            ('build_activity_counts_without_matlab',
+             lambda: ActivityCountService.build_activity_counts_without_matlab(subject_id, motion_data)),
+            ('get_valid_epochs', lambda: RawDataProcessor.get_valid_epochs(subject_id)),
+            ('psg_labels', lambda: PSGLabelService.build(subject_id, valid_epochs)),
+            ('count_feature', lambda: ActivityCountFeatureService.build_from_collection(count_collection,
+                                                                                        valid_epochs, GridCache())),
+            ('hr_std_feature', lambda: HeartRateFeatureService.build_from_collection(heart_rate_collection,
+                                                                                     valid_epochs, GridCache())),
+            ('hr_mean_feature', lambda: HeartRateFeatureService.build_mean_from_collection(heart_rate_collection,
+                                                                                           valid_epochs, GridCache())),
+            ('cosine_feature', lambda: TimeBasedFeatureService.build_cosine(valid_epochs, 0)),
+            ('time_feature', lambda: TimeBasedFeatureService.build_time(valid_epochs, 0)),
+            ('load_files_into_df', lambda: HandleData.load_files_into_df(session_dir)),
+        ]
+        if model is not None:
+            benchmarks.append(('model.predict', predict))
+        return benchmarks
+
+    @staticmethod
+    def measure(function, repeats):
+        wall_times = []
+        cpu_times = []
+        for _ in range(repeats):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            function()
+            wall_times.append(time.perf_counter() - wall_start)
+            cpu_times.append(time.process_time() - cpu_start)
+
+        tracemalloc.start()
+        try:
+            function()
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {'wall_seconds_min': min(wall_times),
+                'wall_seconds_median': float(np.median(wall_times)),
+                'cpu_seconds_median': float(np.median(cpu_times)),
+                'peak_memory_bytes': peak_memory}
+
+    @staticmethod
+    def get_environment():
+        import scipy
+        import sklearn
+
+        return {'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__,
+                'sklearn': sklearn.__version__, 'machine': platform.machine(), 'processor': platform.processor(),
+                'cpu_count': os.cpu_count(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.benchmarks.benchmark_runner --hours 1 8 24 --output outputs/benchmarks/baseline.json
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing stages on synthetic nights.")
+    parser.add_argument('--hours', type=float, nargs='+', default=BenchmarkRunner.DEFAULT_HOURS)
+    parser.add_argument('--repeats', type=int, default=BenchmarkRunner.DEFAULT_REPEATS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default=BenchmarkRunner.DEFAULT_MODEL_PATH)
+    parser.add_argument('--work-dir', default=None, help="Where synthetic nights are written (default: temp dir)")
+    parser.add_argument('--output', default='outputs/benchmarks/benchmark.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        report = BenchmarkRunner.run([hours if hours % 1 else int(hours) for hours in args.hours], args.repeats,
+                                     args.work_dir or temporary_dir, args.model, args.seed)
+
+    output_directory = os.path.dirname(args.output)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,105 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from endpoint_stuff.handle_data import HandleData
+from source import utils
+from source.benchmarks.synthetic_night_generator import SyntheticNightGenerator
+from source.constants import Constants
+from source.inference.forest_bundle import ForestBundle, load_model
+from source.preprocessing.feature_store import FeatureStore
+from source.preprocessing.preprocessing_runner import PreprocessingRunner
+
+
+class ForestInferenceBenchmark(object):
+    # Per-session prediction latency of sklearn's forest against the flattened ForestBundle engine, on the feature
+    # matrix the webhook builds from a synthetic night. Without a saved model, the production Random Forest
+    # configuration from utils.get_classifiers is fit on that matrix, so the tree shapes match what we serve.
+    DEFAULT_HOURS = [1, 8, 12]
+    DEFAULT_REPEATS = 50
+
+    @staticmethod
+    def run(hours_list, repeats, work_dir, model_path=None, seed=0):
+        Constants.update('VERBOSE', False)
+
+        feature_dfs = []
+        for hours in hours_list:
+            session_dir = os.path.join(work_dir, 'night_' + str(hours) + 'h')
+            SyntheticNightGenerator.generate(session_dir, hours=hours, seed=seed)
+            PreprocessingRunner.run_preprocessing(SyntheticNightGenerator.SUBJECT_ID, session_dir)
+            feature_dfs.append((hours, session_dir, HandleData.load_files_into_df(session_dir)))
+
+        if model_path is not None and os.path.exists(model_path) and not ForestBundle.is_bundle_path(model_path):
+            classifier = load_model(model_path)
+        else:
+            print(f"No joblib model at {model_path}, fitting the Random Forest from utils.get_classifiers")
+            classifier = ForestInferenceBenchmark.fit_classifier(feature_dfs[-1][1], feature_dfs[-1][2], seed)
+
+        bundle_path = os.path.join(work_dir, 'model' + ForestBundle.EXTENSION)
+        ForestBundle.from_classifier(classifier).write(bundle_path)
+        bundle = ForestBundle.read(bundle_path)
+
+        results = []
+        for hours, _, feature_df in feature_dfs:
+            is_identical = (np.array_equal(classifier.predict_proba(feature_df), bundle.predict_proba(feature_df)) and
+                            np.array_equal(classifier.predict(feature_df), bundle.predict(feature_df)))
+            for engine, model in [('sklearn', classifier), ('forest_bundle', bundle)]:
+                for method in ['predict', 'predict_proba']:
+                    seconds = ForestInferenceBenchmark.measure(getattr(model, method), feature_df, repeats)
+                    results.append({'hours': hours, 'rows': len(feature_df), 'engine': engine, 'method': method,
+                                    'identical': is_identical, 'seconds_median': float(np.median(seconds)),
+                                    'seconds_min': float(np.min(seconds))})
+                    print(f"  {hours} h ({len(feature_df)} rows) {engine}.{method}: "
+                          f"{np.median(seconds) * 1000:.2f} ms, identical={is_identical}")
+
+        return {'trees': len(classifier.estimators_), 'max_depth': bundle.max_depth,
+                'features': len(feature_dfs[0][2].columns), 'repeats': repeats, 'results': results}
+
+    @staticmethod
+    def fit_classifier(session_dir, feature_df, seed):
+        # Labels of the synthetic night, shifted like the feature lags so each row keeps its epoch's label
+        labels = FeatureStore.read(FeatureStore.get_path_for_session(session_dir, SyntheticNightGenerator.SUBJECT_ID),
+                                   columns=[FeatureStore.LABELS])[FeatureStore.LABELS]
+        labels = np.asarray(labels[-len(feature_df):], dtype=int)
+        if len(np.unique(labels)) < 2:
+            labels = np.random.default_rng(seed).integers(0, 3, len(feature_df))
+
+        classifier = utils.get_classifiers()[0].classifier
+        classifier.set_params(random_state=seed)
+        return classifier.fit(feature_df, labels)
+
+    @staticmethod
+    def measure(function, feature_df, repeats):
+        function(feature_df)  # Warm up caches and lazy imports
+        seconds = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            function(feature_df)
+            seconds.append(time.perf_counter() - start_time)
+        return seconds
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.benchmarks.forest_inference_benchmark --model saved_model/Random_Forest.joblib
+    parser = argparse.ArgumentParser(description="Compare sklearn and ForestBundle prediction latency.")
+    parser.add_argument('--hours', type=float, nargs='+', default=ForestInferenceBenchmark.DEFAULT_HOURS)
+    parser.add_argument('--repeats', type=int, default=ForestInferenceBenchmark.DEFAULT_REPEATS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--model', default='saved_model/Random_Forest.joblib')
+    parser.add_argument('--output', default='outputs/benchmarks/forest_inference.json')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        report = ForestInferenceBenchmark.run([hours if hours % 1 else int(hours) for hours in args.hours],
+                                              args.repeats, temporary_dir, args.model, args.seed)
+
+    output_directory = os.path.dirname(args.output)
+    if output_directory:
+        os.makedirs(output_directory, exist_ok=True)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}")
@@ -0,0 +1,109 @@
+import argparse
+import os
+import shutil
+
+import numpy as np
+
+from endpoint_stuff.handle_data import HandleData
+
+
+class SyntheticNightGenerator(object):
+    # Deterministic stand-in for a night uploaded by the watch app. Acceleration arrives at a nominal 50 Hz with
+    # clock jitter, heart rate at irregular intervals with dropouts, both as chunk files that overlap slightly the
+    # way retried uploads do. Each chunk draws from its own seeded stream, so nights of any length are reproducible
+    # and are generated one chunk at a time.
+    SUBJECT_ID = '0721'
+    ACCELERATION_FREQUENCY = 50
+    TIMING_JITTER_IN_SECONDS = 0.002
+    OVERLAP_ROWS = 25  # Rows of the previous chunk repeated at the start of the next one
+    HEART_RATE_INTERVAL_RANGE = (1.0, 10.0)
+    HEART_RATE_DROPOUT_PROBABILITY = 0.02  # Chance per chunk that the sensor drops out for part of it
+    SLEEP_CYCLE_IN_SECONDS = 90 * 60
+
+    @staticmethod
+    def generate(session_dir, hours=8.0, seed=0, chunk_minutes=5, subject_id=SUBJECT_ID):
+        if not 0 < hours <= 72:
+            raise ValueError("hours must be in (0, 72], got " + str(hours))
+
+        if os.path.exists(session_dir):
+            shutil.rmtree(session_dir)
+        acceleration_dir = os.path.join(session_dir, 'acceleration')
+        heart_rate_dir = os.path.join(session_dir, 'heartrate')
+        os.makedirs(acceleration_dir)
+        os.makedirs(heart_rate_dir)
+
+        duration = hours * 3600.0
+        chunk_duration = chunk_minutes * 60.0
+        number_of_chunks = int(np.ceil(duration / chunk_duration))
+        previous_tail = np.zeros((0, 4))
+
+        for chunk_index in range(number_of_chunks):
+            rng = np.random.default_rng([seed, chunk_index])
+            chunk_start = chunk_index * chunk_duration
+            chunk_end = min(chunk_start + chunk_duration, duration)
+
+            acceleration = SyntheticNightGenerator.make_acceleration(rng, chunk_start, chunk_end)
+            heart_rate = SyntheticNightGenerator.make_heart_rate(rng, chunk_start, chunk_end)
+
+            chunk_name = subject_id + '_chunk_' + str(chunk_index).zfill(5) + '.npy'
+            np.save(os.path.join(acceleration_dir, chunk_name), np.vstack((previous_tail, acceleration)))
+            np.save(os.path.join(heart_rate_dir, chunk_name), heart_rate)
+            previous_tail = acceleration[-SyntheticNightGenerator.OVERLAP_ROWS:]
+
+        HandleData.concat_npy_files(acceleration_dir)
+        HandleData.concat_npy_files(heart_rate_dir)
+        return session_dir
+
+    @staticmethod
+    def make_acceleration(rng, start_time, end_time):
+        period = 1.0 / SyntheticNightGenerator.ACCELERATION_FREQUENCY
+        first_sample = int(np.ceil(start_time / period))
+        last_sample = int(np.ceil(end_time / period))
+        timestamps = np.arange(first_sample, last_sample) * period
+        timestamps = timestamps + rng.normal(0, SyntheticNightGenerator.TIMING_JITTER_IN_SECONDS, len(timestamps))
+        timestamps = np.maximum.accumulate(np.maximum(timestamps, 0))
+
+        # Gravity along a slowly rotating wrist, sensor noise, and movement bursts that cluster near light sleep
+        posture = 0.4 * np.sin(2 * np.pi * timestamps / 2700.0)
+        values = np.column_stack((np.sin(posture), 0.1 * np.cos(timestamps / 1300.0), -np.cos(posture)))
+        values += rng.normal(0, 0.01, np.shape(values))
+
+        light_sleep = np.cos(2 * np.pi * timestamps / SyntheticNightGenerator.SLEEP_CYCLE_IN_SECONDS) > 0.6
+        number_of_bursts = rng.poisson(3 if light_sleep.any() else 0.5)
+        for _ in range(number_of_bursts):
+            burst_start = rng.integers(0, len(timestamps))
+            burst_length = rng.integers(50, 50 * 20)
+            burst = slice(burst_start, burst_start + burst_length)
+            values[burst] += rng.normal(0, rng.uniform(0.1, 0.8), np.shape(values[burst]))
+
+        return np.column_stack((timestamps, values))
+
+    @staticmethod
+    def make_heart_rate(rng, start_time, end_time):
+        low, high = SyntheticNightGenerator.HEART_RATE_INTERVAL_RANGE
+        intervals = rng.uniform(low, high, int((end_time - start_time) / low) + 1)
+        timestamps = start_time + np.cumsum(intervals)
+        timestamps = timestamps[timestamps < end_time]
+
+        if rng.random() < SyntheticNightGenerator.HEART_RATE_DROPOUT_PROBABILITY:
+            dropout_start = rng.uniform(start_time, end_time)
+            dropout_end = dropout_start + rng.uniform(30, 240)
+            timestamps = timestamps[(timestamps < dropout_start) | (timestamps > dropout_end)]
+
+        cycle = np.cos(2 * np.pi * timestamps / SyntheticNightGenerator.SLEEP_CYCLE_IN_SECONDS)
+        drift = -4 * timestamps / (8 * 3600.0)
+        values = 58 + 6 * cycle + drift + rng.normal(0, 1.5, len(timestamps))
+
+        return np.column_stack((timestamps, np.round(values)))
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.benchmarks.synthetic_night_generator data/user_data/synthetic/night_8h --hours 8
+    parser = argparse.ArgumentParser(description="Write a deterministic synthetic night in the upload layout.")
+    parser.add_argument('session_dir')
+    parser.add_argument('--hours', type=float, default=8.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-minutes', type=float, default=5)
+    args = parser.parse_args()
+
+    SyntheticNightGenerator.generate(args.session_dir, args.hours, args.seed, args.chunk_minutes)
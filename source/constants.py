@@ -6,8 +6,23 @@ class Constants(object):
     # REM_THRESHOLD = 0.35  # https://scikit-learn.org/stable/whats_new.html#version-0-21-0
     WAKE_THRESHOLD = 0.5  #
     REM_THRESHOLD = 0.35
+    SLEEP_THRESHOLD = 0.5  # Sleep probability above which a sleep/wake model's epoch is served as sleep
 
     INCLUDE_CIRCADIAN = False
+    # Extend saved count state with new samples instead of recounting the night. Incremental counts always
+    # interpolate onto the 50 Hz grid; MotionResampler's uniform and polyphase speed-ups only apply to full rebuilds,
+    # which every run does with this off.
+    INCREMENTAL_ACTIVITY_COUNTS = True
+    SKIP_UNCHANGED_STAGES = True  # Skip pipeline stages whose input files and parameters match the last run
+    FEATURE_BUILDER_WORKERS = 4  # Threads used to build independent features of one session
+    TRACING = False  # Record per-stage spans of run_preprocessing to outputs/<subject>_trace.jsonl
+    MEMORY_PROFILING = False  # Record tracemalloc peaks and RSS per stage to outputs/<subject>_memory.json
+    PREFER_FOREST_BUNDLES = False  # Serve <version>.forest over <version>.joblib when a model version has both
+    PREDICTION_UPLOAD_FORMAT = 'json'  # 'binary' uploads packed PredictionPacket files instead of JSON arrays
+    PREDICTION_UPLOAD_DELTAS = False  # With 'binary', upload only the epochs changed since the previous upload
+    PREDICTION_UPLOAD_PROBABILITIES = True  # With 'binary', pack quantized class probabilities with the labels
+    PREDICTION_SNAPSHOT_INTERVAL = 12  # With deltas, every Nth upload is still a full snapshot
+    FEATURE_DTYPE = 'float64'  # 'float32' halves the 1 Hz grids and features; timestamps always stay float64
     EPOCH_DURATION_IN_SECONDS = 30
     SECONDS_PER_MINUTE = 60
     SECONDS_PER_DAY = 3600 * 24
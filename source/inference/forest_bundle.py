@@ -0,0 +1,181 @@
+import argparse
+import json
+import os
+import struct
+
+import numpy as np
+
+
+class ForestBundle(object):
+    # A trained random forest flattened into one file: a JSON header, then each node array stored contiguously and
+    # aligned so it can be viewed straight out of a read-only memory map. Every worker that loads the same bundle
+    # shares its pages through the page cache instead of unpickling its own copy of the trees. Outputs match sklearn
+    # bit for bit, but sklearn is still faster on deep trees (0.033 s against 0.084 s per night at depth ~42), so
+    # ModelRegistry only serves a bundle over its joblib twin with Constants.PREFER_FOREST_BUNDLES set.
+    MAGIC = b'FORESTB2'
+    ALIGNMENT = 64
+    EXTENSION = '.forest'
+
+    TREES_PER_BLOCK = 16  # Trees walked together; keeps the per-level index arrays small enough to stay in cache
+
+    # Node arrays, indexed by node across all trees
+    FEATURE = 'feature'
+    THRESHOLD = 'threshold'
+    CHILDREN = 'children'  # Global (left, right) pair per node; a leaf's children are the leaf itself
+    MISSING_GO_TO_LEFT = 'missing_go_to_left'
+    VALUE = 'value'  # Per node class fractions, as sklearn's tree_.value holds them
+    ROOTS = 'roots'  # Index of each tree's root node
+
+    def __init__(self, arrays, classes, feature_names, max_depth):
+        self.arrays = arrays
+        self.classes_ = np.asarray(classes)
+        self.feature_names = feature_names
+        self.max_depth = max_depth
+
+    @staticmethod
+    def is_bundle_path(path):
+        return str(path).endswith(ForestBundle.EXTENSION)
+
+    @staticmethod
+    def from_classifier(classifier):
+        if classifier.n_outputs_ != 1:
+            raise ValueError("Only single output forests can be bundled")
+
+        number_of_classes = len(classifier.classes_)
+        trees = [estimator.tree_ for estimator in classifier.estimators_]
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+
+        def concatenate(get_values):
+            return np.concatenate([get_values(tree) for tree in trees])
+
+        def get_children(tree, offset):
+            nodes = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left < 0
+            return np.column_stack((np.where(is_leaf, nodes, tree.children_left + offset),
+                                    np.where(is_leaf, nodes, tree.children_right + offset)))
+
+        # Leaves get feature 0 so a row sitting on one still reads a column of its own
+        arrays = {ForestBundle.FEATURE: concatenate(lambda tree: np.maximum(tree.feature, 0)).astype(np.intp),
+                  ForestBundle.THRESHOLD: concatenate(lambda tree: tree.threshold).astype(np.float64),
+                  ForestBundle.CHILDREN: np.concatenate([get_children(tree, offset)
+                                                         for tree, offset in zip(trees, offsets)]).astype(np.intp),
+                  ForestBundle.MISSING_GO_TO_LEFT: concatenate(lambda tree: tree.missing_go_to_left).astype(np.uint8),
+                  ForestBundle.VALUE: concatenate(lambda tree: tree.value[:, 0, :number_of_classes]).astype(np.float64),
+                  ForestBundle.ROOTS: offsets[:-1].astype(np.intp)}
+
+        feature_names = None
+        if hasattr(classifier, 'feature_names_in_'):
+            feature_names = [str(name) for name in classifier.feature_names_in_]
+        return ForestBundle(arrays, classifier.classes_, feature_names, max(tree.max_depth for tree in trees))
+
+    def write(self, path):
+        header = {'classes': self.classes_.tolist(), 'feature_names': self.feature_names, 'max_depth': self.max_depth,
+                  'arrays': {}}
+        offset = 0
+        for name, values in self.arrays.items():
+            header['arrays'][name] = {'dtype': values.dtype.str, 'shape': list(values.shape), 'offset': offset}
+            offset = ForestBundle.align(offset + values.nbytes)
+
+        encoded = json.dumps(header).encode('utf-8')
+        data_offset = ForestBundle.align(len(ForestBundle.MAGIC) + 4 + len(encoded))
+
+        # Written next to the target and swapped in so workers never map a partial file
+        temporary_path = str(path) + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            file.write(ForestBundle.MAGIC)
+            file.write(struct.pack('<I', data_offset))
+            file.write(encoded.ljust(data_offset - len(ForestBundle.MAGIC) - 4))
+            for name, values in self.arrays.items():
+                file.seek(data_offset + header['arrays'][name]['offset'])
+                file.write(np.ascontiguousarray(values).tobytes())
+        os.replace(temporary_path, str(path))
+
+    @staticmethod
+    def read(path):
+        with open(str(path), 'rb') as file:
+            if file.read(len(ForestBundle.MAGIC)) != ForestBundle.MAGIC:
+                raise ValueError("Not a forest bundle: " + str(path))
+            data_offset = struct.unpack('<I', file.read(4))[0]
+            header = json.loads(file.read(data_offset - len(ForestBundle.MAGIC) - 4).decode('utf-8'))
+
+        # One read-only map of the whole file; every array is a view into it
+        buffer = np.memmap(str(path), dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, layout in header['arrays'].items():
+            dtype = np.dtype(layout['dtype'])
+            start = data_offset + layout['offset']
+            length = int(np.prod(layout['shape'])) * dtype.itemsize
+            arrays[name] = buffer[start:start + length].view(dtype).reshape(layout['shape'])
+        return ForestBundle(arrays, header['classes'], header['feature_names'], header['max_depth'])
+
+    @staticmethod
+    def align(offset):
+        return -(-offset // ForestBundle.ALIGNMENT) * ForestBundle.ALIGNMENT
+
+    def get_matrix(self, X):
+        # Columns are picked by name when the forest was fit on a DataFrame, as sklearn checks them. Trees compare
+        # float32 inputs against their float64 thresholds, so inputs are rounded to float32 first as well.
+        if self.feature_names is not None and hasattr(X, 'columns'):
+            X = X[self.feature_names]
+        return np.asarray(X, dtype=np.float32)
+
+    def apply(self, X):
+        # Leaf node reached in each tree by each row, shape (trees, rows). A block of trees walks every row together,
+        # one level per step; rows already on a leaf loop back onto it.
+        X = self.get_matrix(X)
+        number_of_rows, number_of_features = X.shape
+        feature = self.arrays[ForestBundle.FEATURE]
+        threshold = self.arrays[ForestBundle.THRESHOLD]
+        children = self.arrays[ForestBundle.CHILDREN].ravel()
+        missing_go_to_left = self.arrays[ForestBundle.MISSING_GO_TO_LEFT]
+        roots = self.arrays[ForestBundle.ROOTS]
+
+        flat_X = X.ravel()
+        has_missing = np.isnan(flat_X).any()
+        row_offsets = np.arange(number_of_rows, dtype=np.intp) * number_of_features
+        leaves = np.empty((len(roots), number_of_rows), dtype=np.intp)
+
+        for block_start in range(0, len(roots), ForestBundle.TREES_PER_BLOCK):
+            block_roots = roots[block_start:block_start + ForestBundle.TREES_PER_BLOCK]
+            nodes = np.repeat(block_roots[:, np.newaxis], number_of_rows, axis=1)
+            for _ in range(self.max_depth):
+                values = flat_X.take(row_offsets + feature.take(nodes))
+                is_left = values <= threshold.take(nodes)
+                if has_missing:
+                    is_left |= np.isnan(values) & (missing_go_to_left.take(nodes) == 1)
+                nodes = children.take(2 * nodes + ~is_left)
+            leaves[block_start:block_start + len(block_roots)] = nodes
+        return leaves
+
+    def predict_proba(self, X):
+        # Summed tree by tree in estimator order, then divided once, the way sklearn's forest accumulates them, so
+        # the result matches it bit for bit
+        leaf_values = self.arrays[ForestBundle.VALUE][self.apply(X)]
+        probabilities = np.zeros(leaf_values.shape[1:], dtype=np.float64)
+        for tree_values in leaf_values:
+            probabilities += tree_values
+        probabilities /= len(leaf_values)
+        return probabilities
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def load_model(path):
+    # Bundles are memory-mapped; anything else is taken to be a joblib pickle of a fitted estimator
+    if ForestBundle.is_bundle_path(path):
+        return ForestBundle.read(path)
+    import joblib
+    return joblib.load(path)
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.inference.forest_bundle saved_model/Random_Forest.joblib saved_model/Random_Forest.forest
+    parser = argparse.ArgumentParser(description="Convert a joblib random forest into a memory-mappable bundle.")
+    parser.add_argument('model_path')
+    parser.add_argument('bundle_path')
+    args = parser.parse_args()
+
+    import joblib
+    ForestBundle.from_classifier(joblib.load(args.model_path)).write(args.bundle_path)
+    print(f"Wrote {args.bundle_path} ({os.path.getsize(args.bundle_path)} bytes)")
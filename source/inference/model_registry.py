@@ -0,0 +1,228 @@
+import hashlib
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from source.constants import Constants
+from source.inference.forest_bundle import ForestBundle, load_model
+
+
+class ModelRegistry(object):
+    # Model versions loaded from a single artifact file, a local directory or an S3 prefix ("s3://bucket/prefix").
+    # In a directory or prefix every <version>.forest or <version>.joblib file is a version, and a CURRENT file
+    # naming one of them selects the active version (the last in sorted order otherwise). A version with both files
+    # loads its joblib pickle unless Constants.PREFER_FOREST_BUNDLES is set. A version is checked against the
+    # feature columns and warmed on a dummy batch before it becomes active, and jobs that already hold a model keep
+    # using it after a swap. A canary version can stay resident and serve a fraction of sessions.
+    EXTENSIONS = [ForestBundle.EXTENSION, '.joblib']
+    CURRENT_FILE_NAME = 'CURRENT'
+    WARM_UP_ROWS = 64
+
+    def __init__(self, source, feature_columns, s3=None, cache_dir=os.path.join('outputs', 'models')):
+        self.source = str(source)
+        self.feature_columns = list(feature_columns)
+        self.s3 = s3
+        self.cache_dir = cache_dir
+        self.models = {}
+        self.paths = {}
+        self.active_version = None
+        self.canary_version = None
+        self.canary_fraction = 0.0
+        self.lock = threading.Lock()
+        self.load_lock = threading.RLock()  # Held while loading or changing which versions are resident
+        self.poller = None
+
+    def is_s3(self):
+        return self.source.startswith('s3://')
+
+    def get_bucket_and_prefix(self):
+        bucket, _, prefix = self.source[len('s3://'):].partition('/')
+        return bucket, prefix.rstrip('/') + '/' if prefix else ''
+
+    def list_names(self):
+        if self.is_s3():
+            bucket, prefix = self.get_bucket_and_prefix()
+            names = []
+            arguments = {'Bucket': bucket, 'Prefix': prefix}
+            while True:
+                response = self.s3.list_objects_v2(**arguments)
+                names.extend(item['Key'][len(prefix):] for item in response.get('Contents', []))
+                if not response.get('IsTruncated'):
+                    return [name for name in names if '/' not in name]
+                arguments['ContinuationToken'] = response['NextContinuationToken']
+
+        return os.listdir(self.source)
+
+    @staticmethod
+    def get_version(name):
+        for extension in ModelRegistry.EXTENSIONS:
+            if name.endswith(extension):
+                return name[:-len(extension)]
+        return None
+
+    def list_versions(self):
+        if not self.is_s3() and not os.path.isdir(self.source):
+            # A single artifact, e.g. MODEL_PATH=saved_model/Random_Forest.joblib, is its only version
+            name = os.path.basename(self.source)
+            return {os.path.splitext(name)[0]: name}
+
+        artifacts = {}
+        for name in sorted(self.list_names(), key=lambda name: (ModelRegistry.get_preference(name), name)):
+            version = ModelRegistry.get_version(name)
+            if version is not None:
+                artifacts.setdefault(version, name)  # Each version's preferred artifact comes first
+        return artifacts
+
+    @staticmethod
+    def get_preference(name):
+        # Lower is preferred; bundles only come first when opted into
+        is_bundle = ForestBundle.is_bundle_path(name)
+        return 0 if is_bundle == Constants.PREFER_FOREST_BUNDLES else 1
+
+    def get_current_version(self):
+        versions = self.list_versions()
+        if not versions:
+            raise FileNotFoundError("No model artifacts in " + self.source)
+
+        current = None
+        if self.is_s3():
+            bucket, prefix = self.get_bucket_and_prefix()
+            try:
+                response = self.s3.get_object(Bucket=bucket, Key=prefix + ModelRegistry.CURRENT_FILE_NAME)
+                current = response['Body'].read().decode('utf-8')
+            except self.s3.exceptions.NoSuchKey:
+                pass
+        elif os.path.isdir(self.source):
+            current_path = os.path.join(self.source, ModelRegistry.CURRENT_FILE_NAME)
+            if os.path.exists(current_path):
+                with open(current_path, 'r') as file:
+                    current = file.read()
+
+        if current is None:
+            return sorted(versions)[-1]
+        current = current.strip()
+        if current not in versions:
+            raise FileNotFoundError(ModelRegistry.CURRENT_FILE_NAME + " names " + current + ", which is not in " +
+                                    self.source)
+        return current
+
+    def fetch(self, version):
+        name = self.list_versions()[version]
+        if not self.is_s3():
+            return os.path.join(self.source, name) if os.path.isdir(self.source) else self.source
+
+        # Versions are immutable, so a cached download is reused. Downloads land next to their final name and are
+        # swapped in, which leaves any bundle still mapped from an earlier file untouched.
+        bucket, prefix = self.get_bucket_and_prefix()
+        local_path = os.path.join(self.cache_dir, name)
+        if not os.path.exists(local_path):
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temporary_path = local_path + '.download'
+            self.s3.download_file(Bucket=bucket, Key=prefix + name, Filename=temporary_path)
+            os.replace(temporary_path, local_path)
+        return local_path
+
+    def load(self, version):
+        with self.load_lock:
+            if version in self.models:
+                return self.models[version]
+
+            start_time = time.time()
+            path = self.fetch(version)
+            model = load_model(path)
+            self.verify_schema(version, model)
+            self.warm_up(model)
+
+            with self.lock:
+                self.models[version] = model
+                self.paths[version] = path
+            print(f"Loaded model {version} from {path} in {time.time() - start_time:.3f} seconds")
+            return model
+
+    def verify_schema(self, version, model):
+        if isinstance(model, ForestBundle):
+            feature_names = model.feature_names
+        else:
+            feature_names = getattr(model, 'feature_names_in_', None)
+
+        if feature_names is not None:
+            if [str(name) for name in feature_names] != self.feature_columns:
+                raise ValueError("Model " + version + " expects features " + str(list(feature_names)) +
+                                 ", the pipeline builds " + str(self.feature_columns))
+        elif getattr(model, 'n_features_in_', len(self.feature_columns)) != len(self.feature_columns):
+            raise ValueError("Model " + version + " expects " + str(model.n_features_in_) + " features, the pipeline "
+                             "builds " + str(len(self.feature_columns)))
+
+    def warm_up(self, model):
+        # Touches every tree once, so the first real session does not pay for page faults and lazy imports
+        import pandas as pd
+        dummy_batch = pd.DataFrame(np.zeros((ModelRegistry.WARM_UP_ROWS, len(self.feature_columns))),
+                                   columns=self.feature_columns)
+        model.predict(dummy_batch)
+
+    def activate(self, version):
+        with self.load_lock:
+            self.load(version)
+            with self.lock:
+                previous_version = self.active_version
+                self.active_version = version
+            if previous_version != version:
+                print(f"Active model is now {version} (was {previous_version})")
+            self.unload_unused()
+
+    def set_canary(self, version, fraction):
+        with self.load_lock:
+            if version is not None:
+                self.load(version)
+            with self.lock:
+                self.canary_version = version
+                self.canary_fraction = fraction if version is not None else 0.0
+            self.unload_unused()
+
+    def unload_unused(self):
+        with self.lock:
+            for version in list(self.models):
+                if version not in (self.active_version, self.canary_version):
+                    # Jobs still holding the model keep it alive until they finish
+                    del self.models[version]
+                    del self.paths[version]
+
+    def refresh(self):
+        version = self.get_current_version()
+        if version != self.active_version:
+            self.activate(version)
+        return version
+
+    def get_model(self, session_key=None):
+        # Returns (version, model, path) so a job keeps one consistent model even if a swap happens mid-way.
+        # A session always lands on the same side of the canary split.
+        with self.lock:
+            version = self.active_version
+            if self.canary_version is not None and session_key is not None:
+                digest = hashlib.sha256(str(session_key).encode('utf-8')).digest()
+                if int.from_bytes(digest[:8], 'big') / 2 ** 64 < self.canary_fraction:
+                    version = self.canary_version
+            if version is None:
+                raise RuntimeError("No model version is active")
+            return version, self.models[version], self.paths[version]
+
+    def get_status(self):
+        with self.lock:
+            return {'source': self.source, 'active': self.active_version, 'canary': self.canary_version,
+                    'canary_fraction': self.canary_fraction, 'resident': sorted(self.models)}
+
+    def start_polling(self, interval):
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    # A bad artifact leaves the current model serving
+                    print(f"Model refresh from {self.source} failed:\n{traceback.format_exc()}")
+
+        self.poller = threading.Thread(target=poll, name='model-registry-poller', daemon=True)
+        self.poller.start()
@@ -0,0 +1,101 @@
+import json
+import struct
+import zlib
+
+import numpy as np
+
+
+class PredictionPacket(object):
+    # Binary prediction upload: MAGIC, a uint32 header length, a JSON header, one uint8 label per epoch, then
+    # optionally the class probabilities quantized to uint16 and zlib-compressed. The header's ranges list which
+    # epochs ([first, count] pairs) the packet carries: a snapshot covers the whole night, a delta only the epochs
+    # that changed since the packet with the previous sequence number.
+    MAGIC = b'SLPPRED1'
+    PROBABILITY_SCALE = 65535
+
+    @staticmethod
+    def encode(labels, probabilities, header, ranges=None):
+        labels = np.asarray(labels)
+        if labels.size and (labels.min() < 0 or labels.max() > 255):
+            raise ValueError("Labels must fit in uint8 to be packed")
+
+        if ranges is None:
+            ranges = [[0, len(labels)]] if len(labels) else []
+        indices = PredictionPacket.get_indices(ranges)
+        header = dict(header, ranges=ranges, total_epochs=len(labels),
+                      probabilities=probabilities is not None)
+
+        body = labels[indices].astype(np.uint8).tobytes()
+        if probabilities is not None:
+            quantized = PredictionPacket.quantize(np.asarray(probabilities)[indices])
+            header['number_of_classes'] = quantized.shape[1]
+            body += zlib.compress(quantized.tobytes(), 6)
+
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        return PredictionPacket.MAGIC + struct.pack('<I', len(encoded)) + encoded + body
+
+    @staticmethod
+    def decode(packet):
+        # Returns the header, the carried epoch indices, their labels and (if present) dequantized probabilities
+        if packet[:len(PredictionPacket.MAGIC)] != PredictionPacket.MAGIC:
+            raise ValueError("Not a prediction packet")
+        offset = len(PredictionPacket.MAGIC) + 4
+        header_length = struct.unpack('<I', packet[len(PredictionPacket.MAGIC):offset])[0]
+        header = json.loads(packet[offset:offset + header_length].decode('utf-8'))
+        offset += header_length
+
+        indices = PredictionPacket.get_indices(header['ranges'])
+        labels = np.frombuffer(packet, dtype=np.uint8, count=len(indices), offset=offset)
+        probabilities = None
+        if header['probabilities']:
+            quantized = np.frombuffer(zlib.decompress(packet[offset + len(indices):]), dtype=np.uint16)
+            probabilities = quantized.reshape(len(indices), header['number_of_classes']) / \
+                PredictionPacket.PROBABILITY_SCALE
+        return header, indices, labels, probabilities
+
+    @staticmethod
+    def apply(packet, labels=None, probabilities=None):
+        # What a client does with each packet in sequence order: start from a snapshot, then patch in deltas
+        header, indices, packet_labels, packet_probabilities = PredictionPacket.decode(packet)
+        total_epochs = header['total_epochs']
+
+        new_labels = np.zeros(total_epochs, dtype=np.uint8)
+        if labels is not None:
+            new_labels[:min(len(labels), total_epochs)] = labels[:total_epochs]
+        new_labels[indices] = packet_labels
+
+        new_probabilities = None
+        if packet_probabilities is not None:
+            new_probabilities = np.zeros((total_epochs, header['number_of_classes']))
+            if probabilities is not None:
+                new_probabilities[:min(len(probabilities), total_epochs)] = probabilities[:total_epochs]
+            new_probabilities[indices] = packet_probabilities
+        return header, new_labels, new_probabilities
+
+    @staticmethod
+    def quantize(probabilities):
+        return np.rint(np.clip(probabilities, 0, 1) * PredictionPacket.PROBABILITY_SCALE).astype(np.uint16)
+
+    @staticmethod
+    def get_indices(ranges):
+        if not ranges:
+            return np.zeros(0, dtype=np.intp)
+        return np.concatenate([np.arange(first, first + count) for first, count in ranges]).astype(np.intp)
+
+    @staticmethod
+    def get_changed_ranges(labels, quantized, previous_labels, previous_quantized, merge_gap=8):
+        # Epochs whose label or quantized probabilities differ, plus any epochs past the previous night's end.
+        # Runs separated by fewer than merge_gap unchanged epochs are merged to keep the header short.
+        shared = min(len(labels), len(previous_labels))
+        changed = np.ones(len(labels), dtype=bool)
+        changed[:shared] = labels[:shared] != previous_labels[:shared]
+        if quantized is not None and previous_quantized is not None:
+            changed[:shared] |= np.any(quantized[:shared] != previous_quantized[:shared], axis=1)
+
+        changed_epochs = np.flatnonzero(changed)
+        if len(changed_epochs) == 0:
+            return []
+        breaks = np.flatnonzero(np.diff(changed_epochs) > merge_gap)
+        starts = np.concatenate(([changed_epochs[0]], changed_epochs[breaks + 1]))
+        ends = np.concatenate((changed_epochs[breaks], [changed_epochs[-1]])) + 1
+        return [[int(start), int(end - start)] for start, end in zip(starts, ends)]
@@ -0,0 +1,48 @@
+import numpy as np
+
+from source.analysis.setup.sleep_label import SleepWakeLabel, ThreeClassLabel
+from source.constants import Constants
+
+
+class ThresholdDecoder(object):
+    # Turns class probabilities into labels with the same rules as the analysis code. Thresholds may be scalars,
+    # giving one label per epoch, or arrays, giving a (thresholds, epochs) array with every threshold set decoded.
+
+    @staticmethod
+    def decode_sleep_wake(probabilities, sleep_threshold, inclusive=True):
+        sleep_probabilities = np.asarray(probabilities)[:, SleepWakeLabel.sleep.value]
+        sleep_threshold = np.asarray(sleep_threshold, dtype=np.float64)[..., np.newaxis]
+        is_sleep = sleep_probabilities >= sleep_threshold if inclusive else sleep_probabilities > sleep_threshold
+
+        return np.where(is_sleep, SleepWakeLabel.sleep.value, SleepWakeLabel.wake.value)
+
+    @staticmethod
+    def decode_three_class(probabilities, wake_threshold, rem_threshold):
+        probabilities = np.asarray(probabilities)
+        wake_threshold = np.asarray(wake_threshold, dtype=np.float64)[..., np.newaxis]
+        rem_threshold = np.asarray(rem_threshold, dtype=np.float64)[..., np.newaxis]
+
+        return np.where(probabilities[:, ThreeClassLabel.wake.value] >= wake_threshold, ThreeClassLabel.wake.value,
+                        np.where(probabilities[:, ThreeClassLabel.rem.value] >= rem_threshold,
+                                 ThreeClassLabel.rem.value, ThreeClassLabel.nrem.value))
+
+    @staticmethod
+    def get_serving_thresholds(classes):
+        classes = np.asarray(classes).tolist()
+        if classes == [label.value for label in SleepWakeLabel]:
+            return {'sleep': Constants.SLEEP_THRESHOLD}
+        if classes == [label.value for label in ThreeClassLabel]:
+            return {'wake': Constants.WAKE_THRESHOLD, 'rem': Constants.REM_THRESHOLD}
+        return {}
+
+    @staticmethod
+    def decode(probabilities, classes):
+        # Sleep/wake and wake/NREM/REM models are thresholded; any other label set falls back to the most likely
+        # class, as model.predict would pick it
+        thresholds = ThresholdDecoder.get_serving_thresholds(classes)
+        if 'sleep' in thresholds:
+            # Strictly above, so an epoch tied at 0.5 stays wake as argmax (and model.predict) labelled it
+            return ThresholdDecoder.decode_sleep_wake(probabilities, thresholds['sleep'], inclusive=False)
+        if 'wake' in thresholds:
+            return ThresholdDecoder.decode_three_class(probabilities, thresholds['wake'], thresholds['rem'])
+        return np.asarray(classes).take(np.argmax(probabilities, axis=1), axis=0)
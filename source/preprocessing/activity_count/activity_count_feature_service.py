@@ -5,10 +5,13 @@ from source import utils
 from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_service import ActivityCountService
 from source.preprocessing.epoch import Epoch
+from source.preprocessing.epoch_array import EpochArray
+from source.preprocessing.grid_cache import GridCache
 
 
 class ActivityCountFeatureService(object):
     WINDOW_SIZE = 10 * 30 - 15
+    GRID_NAME = 'activity_count'
 
     @staticmethod
     def load(subject_id):
@@ -35,30 +38,22 @@ class ActivityCountFeatureService(object):
         return indices_in_range[0][0]
 
     @staticmethod
-    def build(subject_id, valid_epochs):
+    def build(subject_id, valid_epochs, grid_cache=None):
         activity_count_collection = ActivityCountService.load_cropped(subject_id)
-        return ActivityCountFeatureService.build_from_collection(activity_count_collection, valid_epochs)
+        return ActivityCountFeatureService.build_from_collection(activity_count_collection, valid_epochs, grid_cache)
 
     @staticmethod
-    def build_from_collection(activity_count_collection, valid_epochs):
-        count_features = []
+    def build_from_collection(activity_count_collection, valid_epochs, grid_cache=None):
+        valid_epochs = EpochArray.from_epochs(valid_epochs)
 
         interpolated_timestamps, interpolated_counts = ActivityCountFeatureService.interpolate(
-            activity_count_collection)
+            activity_count_collection, grid_cache)
 
         min_timestamp = np.amin(interpolated_timestamps)
+        valid_epochs = valid_epochs[valid_epochs.timestamps - min_timestamp >= ActivityCountFeatureService.WINDOW_SIZE]
 
-        for epoch in valid_epochs:
-            if epoch.timestamp - min_timestamp < ActivityCountFeatureService.WINDOW_SIZE:
-                continue
-
-            indices_in_range = ActivityCountFeatureService.get_window(interpolated_timestamps, epoch)
-            activity_counts_in_range = interpolated_counts[indices_in_range]
-
-            feature = ActivityCountFeatureService.get_feature(activity_counts_in_range)
-            count_features.append(feature)
-
-        return np.array(count_features)
+        starts, ends = valid_epochs.get_window_bounds(interpolated_timestamps, ActivityCountFeatureService.WINDOW_SIZE)
+        return utils.apply_to_windows(interpolated_counts, starts, ends, ActivityCountFeatureService.get_features)
 
     @staticmethod
     def get_feature(count_values):
@@ -66,10 +61,13 @@ class ActivityCountFeatureService(object):
         return convolution
 
     @staticmethod
-    def interpolate(activity_count_collection):
-        timestamps = activity_count_collection.timestamps.flatten()
-        activity_count_values = activity_count_collection.values.flatten()
-        interpolated_timestamps = np.arange(np.amin(timestamps),
-                                            np.amax(timestamps), 1)
-        interpolated_counts = np.interp(interpolated_timestamps, timestamps, activity_count_values)
-        return interpolated_timestamps, interpolated_counts
+    def get_features(count_windows):
+        weights = utils.gauss_causal_weights(np.shape(count_windows)[1])
+        return count_windows @ weights.astype(count_windows.dtype, copy=False)
+
+    @staticmethod
+    def interpolate(activity_count_collection, grid_cache=None):
+        if grid_cache is None:
+            grid_cache = GridCache()
+
+        return grid_cache.get_grid(ActivityCountFeatureService.GRID_NAME, activity_count_collection)
@@ -1,4 +1,5 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import pandas as pd
@@ -7,9 +8,17 @@ from scipy.signal import butter, filtfilt
 from source import utils
 from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_collection import ActivityCountCollection
+from source.preprocessing.motion.motion_resampler import MotionResampler
 
 
 class ActivityCountService(object):
+    SAMPLING_FREQUENCY = 50
+    COUNT_EPOCH_IN_SECONDS = 15
+    CHUNK_DURATION_IN_SECONDS = 15 * 60  # Must be a whole number of count epochs
+    CHUNK_PADDING_IN_SECONDS = 20
+    BIN_TOP_EDGE = 5
+    NUMBER_OF_BINS = 128
+
     @staticmethod
     def load_cropped(subject_id):
         activity_counts_path = ActivityCountService.get_cropped_file_path(subject_id)
@@ -31,40 +40,158 @@ class ActivityCountService(object):
             utils.get_project_root()) + '/source/make_counts.m\'); exit;\"')
 
     @staticmethod
-    def build_activity_counts_without_matlab(subject_id, data):
+    def build_activity_counts_without_matlab(subject_id, data, workers=1):
+        # z is the last column both in full (t, x, y, z) and column-projected (t, z) motion data
+        counts = ActivityCountService.build_counts(data[:, 0], data[:, -1], workers)
+
+        time_counts = np.linspace(np.min(data[:, 0]), np.max(data[:, 0]), np.shape(counts)[0])
+        time_counts = np.expand_dims(time_counts, axis=1)
+        counts = np.expand_dims(counts, axis=1)
+        output = np.hstack((time_counts, counts))
 
-        fs = 50
-        time = np.arange(np.amin(data[:, 0]), np.amax(data[:, 0]), 1.0 / fs)
-        z_data = np.interp(time, data[:, 0], data[:, 3])
+        activity_count_output_path = ActivityCountService.get_cropped_file_path(subject_id)
+        np.save(activity_count_output_path, output)
 
+    @staticmethod
+    def build_counts(timestamps, z_values, workers=1):
+        # The 50 Hz signal is processed in chunks of whole count epochs, each filtered with enough padding on both
+        # sides for the filter transient to decay, so peak memory depends on the chunk length, not the night length
+        fs = ActivityCountService.SAMPLING_FREQUENCY
+        resampler = MotionResampler(timestamps, z_values, fs)
+        if Constants.VERBOSE:
+            print("Resampling motion by " + resampler.mode.name + "...")
+
+        number_of_samples = resampler.length
+        chunk_length = ActivityCountService.CHUNK_DURATION_IN_SECONDS * fs
+        padding = ActivityCountService.CHUNK_PADDING_IN_SECONDS * fs
+
+        chunk_starts = np.arange(0, number_of_samples, chunk_length)
+        chunk_ends = np.minimum(chunk_starts + chunk_length, number_of_samples)
+        region_starts = np.maximum(chunk_starts - padding, 0)
+        region_ends = np.minimum(chunk_ends + padding, number_of_samples)
+
+        b, a = ActivityCountService.get_filter()
+
+        def count_chunk(chunk_index):
+            region_start = region_starts[chunk_index]
+            z_data = resampler.get_values(region_start, region_ends[chunk_index])
+            z_filt = filtfilt(b, a, z_data)
+
+            return ActivityCountService.bin_and_count(
+                z_filt[chunk_starts[chunk_index] - region_start:chunk_ends[chunk_index] - region_start])
+
+        chunk_indices = range(np.shape(chunk_starts)[0])
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                chunk_counts = list(executor.map(count_chunk, chunk_indices))
+        else:
+            chunk_counts = [count_chunk(chunk_index) for chunk_index in chunk_indices]
+
+        counts = np.concatenate(chunk_counts) if chunk_counts else np.zeros(0)
+        return ActivityCountService.scale_counts(counts)
+
+    @staticmethod
+    def build_activity_counts_incrementally(subject_id, data):
+        # Imported here because the incremental builder depends on this service
+        from source.preprocessing.activity_count.incremental_activity_count_builder import \
+            IncrementalActivityCountBuilder
+
+        state_path = ActivityCountService.get_state_file_path(subject_id)
+        builder = None
+        if state_path.is_file():
+            builder = IncrementalActivityCountBuilder.load(state_path)
+
+        # Start over unless the cropped recording begins with exactly the samples the saved state was built from.
+        # A late or retried chunk that lands inside the night changes that prefix and forces a full recount.
+        timestamps = data[:, 0]
+        z_values = data[:, -1]
+        fingerprint = IncrementalActivityCountBuilder.new_fingerprint()
+        if builder is not None:
+            if builder.prefix_digest and builder.prefix_length <= np.shape(data)[0]:
+                IncrementalActivityCountBuilder.update_fingerprint(fingerprint, timestamps, z_values, 0,
+                                                                   builder.prefix_length)
+            if fingerprint.hexdigest() != builder.prefix_digest:
+                if Constants.VERBOSE:
+                    print("Motion data changed before the last counted sample, recounting...")
+                builder = None
+                fingerprint = IncrementalActivityCountBuilder.new_fingerprint()
+        if builder is None:
+            builder = IncrementalActivityCountBuilder()
+
+        IncrementalActivityCountBuilder.update_fingerprint(fingerprint, timestamps, z_values, builder.prefix_length,
+                                                           np.shape(data)[0])
+        builder.append(timestamps, z_values)
+        builder.prefix_length = np.shape(data)[0]
+        builder.prefix_digest = fingerprint.hexdigest()
+        builder.save(state_path)
+
+        counts = builder.get_counts()
+        time_counts = np.linspace(np.min(data[:, 0]), np.max(data[:, 0]), np.shape(counts)[0])
+        output = np.hstack((np.expand_dims(time_counts, axis=1), np.expand_dims(counts, axis=1)))
+
+        activity_count_output_path = ActivityCountService.get_cropped_file_path(subject_id)
+        np.save(activity_count_output_path, output)
+
+    @staticmethod
+    def get_state_file_path(subject_id):
+        return Constants.CROPPED_FILE_PATH.joinpath(subject_id + "_count_state.npz")
+
+    @staticmethod
+    def get_state_file_path_for_session(subject_id, data_path):
+        return os.path.join(data_path, 'outputs', 'cropped', subject_id + "_count_state.npz")
+
+    @staticmethod
+    def remove_state(subject_id, data_path):
+        # Drops the saved incremental count state so the next counts stage recounts the whole night
+        state_path = ActivityCountService.get_state_file_path_for_session(subject_id, data_path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    @staticmethod
+    def scale_counts(counts):
+        counts = counts.astype(float)
+        counts -= 18
+        counts *= 3.07
+        np.maximum(counts, 0, out=counts)
+        return counts
+
+    @staticmethod
+    def get_filter(output='ba'):
+        fs = ActivityCountService.SAMPLING_FREQUENCY
         cf_low = 3
         cf_hi = 11
         order = 5
         w1 = cf_low / (fs / 2)
         w2 = cf_hi / (fs / 2)
         pass_band = [w1, w2]
-        b, a = butter(order, pass_band, 'bandpass')
-
-        z_filt = filtfilt(b, a, z_data)
-        z_filt = np.abs(z_filt)
-        top_edge = 5
-        bottom_edge = 0
-        number_of_bins = 128
-
-        bin_edges = np.linspace(bottom_edge, top_edge, number_of_bins + 1)
-        binned = np.digitize(z_filt, bin_edges)
-        epoch = 15
-        counts = ActivityCountService.max2epochs(binned, fs, epoch)
-        counts = (counts - 18) * 3.07
-        counts[counts < 0] = 0
-
-        time_counts = np.linspace(np.min(data[:, 0]), max(data[:, 0]), np.shape(counts)[0])
-        time_counts = np.expand_dims(time_counts, axis=1)
-        counts = np.expand_dims(counts, axis=1)
-        output = np.hstack((time_counts, counts))
+        return butter(order, pass_band, 'bandpass', output=output)
 
-        activity_count_output_path = ActivityCountService.get_cropped_file_path(subject_id)
-        np.save(activity_count_output_path, output)
+    @staticmethod
+    def bin_and_count(z_filt):
+        # Same counts as np.digitize against the uniform bin edges followed by max2epochs, computed on a single
+        # uint8 buffer: bins come from a scaled floor, corrected where rounding put a sample across its edge, and
+        # the per-second max and per-epoch sum are taken on C-order views instead of F-order copies
+        fs = ActivityCountService.SAMPLING_FREQUENCY
+        epoch_length = ActivityCountService.COUNT_EPOCH_IN_SECONDS * fs
+        number_of_bins = ActivityCountService.NUMBER_OF_BINS
+
+        number_of_samples = (np.shape(z_filt)[0] // epoch_length) * epoch_length
+        magnitudes = np.abs(z_filt[:number_of_samples])
+
+        bin_width = ActivityCountService.BIN_TOP_EDGE / number_of_bins
+        bin_edges = np.linspace(0, ActivityCountService.BIN_TOP_EDGE, number_of_bins + 1)
+
+        scaled = np.floor(magnitudes / bin_width)
+        np.clip(scaled, 0, number_of_bins, out=scaled)
+        bins = scaled.astype(np.uint8)
+        del scaled
+
+        bins -= magnitudes < bin_edges[bins]
+        bins += (bins < number_of_bins) & (magnitudes >= bin_edges[np.minimum(bins + 1, number_of_bins)])
+        bins += 1
+
+        seconds_max = bins.reshape(-1, fs).max(axis=1)
+        return seconds_max.reshape(-1, ActivityCountService.COUNT_EPOCH_IN_SECONDS).sum(axis=1, dtype=np.int64)
 
     @staticmethod
     def max2epochs(data, fs, epoch):
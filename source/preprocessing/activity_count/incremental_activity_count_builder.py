@@ -0,0 +1,182 @@
+import hashlib
+
+import numpy as np
+from scipy.signal import sosfilt, sosfilt_zi
+
+from source.preprocessing.activity_count.activity_count_service import ActivityCountService
+
+
+class IncrementalActivityCountBuilder(object):
+    # Extends activity counts as acceleration arrives. The forward pass of the band-pass filter is carried across
+    # arrivals in its second-order-section state; the backward pass is rerun over a trailing window only. Counts that
+    # end more than CHUNK_PADDING_IN_SECONDS before the newest sample are final, later ones are provisional and are
+    # recomputed on the next arrival, so the output matches a zero-phase filter run over the whole recording.
+    # The raw samples the state was built from are fingerprinted, so a chunk that arrives late and lands before the
+    # newest sample (e.g. filling a gap) is noticed and the counts are rebuilt rather than silently missing it.
+    # Samples are always linearly interpolated onto the grid: the uniform and polyphase modes of MotionResampler need
+    # the whole night to pick the mode and to filter across chunk edges, so they only apply to the whole-night path.
+    FINGERPRINT_BLOCK_ROWS = 1 << 16
+
+    def __init__(self):
+        self.sos = ActivityCountService.get_filter(output='sos')
+        self.edge = IncrementalActivityCountBuilder.get_edge_length(self.sos)
+
+        self.start_time = None
+        self.spacing = None
+        self.grid_length = 0
+        self.finalized_length = 0
+        self.forward_state = None
+        self.forward_tail = np.zeros(0)
+        self.signal_tail = np.zeros(0)
+        self.raw_timestamps = np.zeros(0)
+        self.raw_values = np.zeros(0)
+        self.counts = np.zeros(0)
+        self.provisional_counts = np.zeros(0)
+        self.prefix_length = 0  # Raw samples covered by prefix_digest
+        self.prefix_digest = ''
+
+    @staticmethod
+    def new_fingerprint():
+        return hashlib.blake2b(digest_size=16)
+
+    @staticmethod
+    def update_fingerprint(fingerprint, timestamps, z_values, start, end):
+        # Rows are hashed as interleaved (t, z) pairs, so the digest does not depend on how the samples were split
+        for block_start in range(start, end, IncrementalActivityCountBuilder.FINGERPRINT_BLOCK_ROWS):
+            block_end = min(block_start + IncrementalActivityCountBuilder.FINGERPRINT_BLOCK_ROWS, end)
+            rows = np.column_stack((timestamps[block_start:block_end], z_values[block_start:block_end]))
+            fingerprint.update(rows.astype(np.float64, copy=False).tobytes())
+
+    @staticmethod
+    def get_edge_length(sos):
+        # Odd-extension length used by scipy.signal.sosfiltfilt
+        number_of_taps = 2 * np.shape(sos)[0] + 1
+        number_of_taps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+        return 3 * number_of_taps
+
+    def get_counts(self):
+        return np.concatenate((self.counts, self.provisional_counts))
+
+    def get_last_timestamp(self):
+        if np.shape(self.raw_timestamps)[0] == 0:
+            return None
+        return self.raw_timestamps[-1]
+
+    def append(self, timestamps, z_values):
+        timestamps = np.asarray(timestamps, dtype=float)
+        z_values = np.asarray(z_values, dtype=float)
+
+        last_timestamp = self.get_last_timestamp()
+        if last_timestamp is not None:
+            is_new = timestamps > last_timestamp
+            timestamps = timestamps[is_new]
+            z_values = z_values[is_new]
+
+        if np.shape(timestamps)[0] == 0:
+            return
+
+        self.raw_timestamps = np.concatenate((self.raw_timestamps, timestamps))
+        self.raw_values = np.concatenate((self.raw_values, z_values))
+
+        fs = ActivityCountService.SAMPLING_FREQUENCY
+        step = 1.0 / fs
+        if self.start_time is None:
+            self.start_time = self.raw_timestamps[0]
+            self.spacing = (self.start_time + step) - self.start_time
+
+        grid_end = int(np.ceil((self.raw_timestamps[-1] - self.start_time) / step))
+        if self.forward_state is None and grid_end <= self.edge:
+            return  # Not enough samples yet to seed the filter, keep them until the next arrival
+
+        chunk_length = ActivityCountService.CHUNK_DURATION_IN_SECONDS * fs
+        for piece_start in range(self.grid_length, grid_end, chunk_length):
+            piece_end = min(piece_start + chunk_length, grid_end)
+            time = self.start_time + np.arange(piece_start, piece_end) * self.spacing
+
+            self.forward(np.interp(time, self.raw_timestamps, self.raw_values))
+            self.update_counts()
+
+        # Two raw samples are enough to interpolate grid points up to the next arrival
+        self.raw_timestamps = self.raw_timestamps[-2:]
+        self.raw_values = self.raw_values[-2:]
+
+    def forward(self, signal):
+        if self.forward_state is None:
+            left_extension = 2 * signal[0] - signal[self.edge:0:-1]
+            _, self.forward_state = sosfilt(self.sos, left_extension,
+                                            zi=sosfilt_zi(self.sos) * left_extension[0])
+
+        filtered, self.forward_state = sosfilt(self.sos, signal, zi=self.forward_state)
+
+        self.forward_tail = np.concatenate((self.forward_tail, filtered))
+        self.signal_tail = np.concatenate((self.signal_tail, signal))[-(self.edge + 1):]
+        self.grid_length += np.shape(signal)[0]
+
+    def update_counts(self):
+        right_extension = 2 * self.signal_tail[-1] - self.signal_tail[-2:-(self.edge + 2):-1]
+        extension_filtered, _ = sosfilt(self.sos, right_extension, zi=self.forward_state)
+
+        forward_filtered = np.concatenate((self.forward_tail, extension_filtered))
+        backward_filtered, _ = sosfilt(self.sos, forward_filtered[::-1],
+                                       zi=sosfilt_zi(self.sos) * forward_filtered[-1])
+        backward_filtered = backward_filtered[::-1][:np.shape(self.forward_tail)[0]]
+
+        tail_start = self.grid_length - np.shape(self.forward_tail)[0]
+        counts = ActivityCountService.bin_and_count(np.abs(backward_filtered[self.finalized_length - tail_start:]))
+        counts = ActivityCountService.scale_counts(counts)
+
+        fs = ActivityCountService.SAMPLING_FREQUENCY
+        epoch_length = ActivityCountService.COUNT_EPOCH_IN_SECONDS * fs
+        padding = ActivityCountService.CHUNK_PADDING_IN_SECONDS * fs
+
+        number_of_final_epochs = max(0, (self.grid_length - padding - self.finalized_length) // epoch_length)
+        number_of_final_epochs = min(number_of_final_epochs, np.shape(counts)[0])
+
+        self.counts = np.concatenate((self.counts, counts[:number_of_final_epochs]))
+        self.provisional_counts = counts[number_of_final_epochs:]
+        self.finalized_length += number_of_final_epochs * epoch_length
+
+        new_tail_start = max(self.finalized_length - padding, 0)
+        self.forward_tail = self.forward_tail[new_tail_start - tail_start:]
+
+    def save(self, path):
+        # Unset fields are stored as NaN or empty arrays so the state file never needs pickling
+        forward_state = self.forward_state if self.forward_state is not None else np.zeros((0, 2))
+        np.savez(path,
+                 start_time=self.start_time if self.start_time is not None else np.nan,
+                 spacing=self.spacing if self.spacing is not None else np.nan,
+                 grid_length=self.grid_length,
+                 finalized_length=self.finalized_length,
+                 forward_state=forward_state,
+                 forward_tail=self.forward_tail,
+                 signal_tail=self.signal_tail,
+                 raw_timestamps=self.raw_timestamps,
+                 raw_values=self.raw_values,
+                 counts=self.counts,
+                 provisional_counts=self.provisional_counts,
+                 prefix_length=self.prefix_length,
+                 prefix_digest=self.prefix_digest)
+
+    @staticmethod
+    def load(path):
+        state = np.load(str(path))
+        builder = IncrementalActivityCountBuilder()
+
+        if not np.isnan(state['start_time']):
+            builder.start_time = state['start_time'].item()
+            builder.spacing = state['spacing'].item()
+        builder.grid_length = int(state['grid_length'])
+        builder.finalized_length = int(state['finalized_length'])
+        if np.shape(state['forward_state'])[0] > 0:
+            builder.forward_state = state['forward_state']
+        builder.forward_tail = state['forward_tail']
+        builder.signal_tail = state['signal_tail']
+        builder.raw_timestamps = state['raw_timestamps']
+        builder.raw_values = state['raw_values']
+        builder.counts = state['counts']
+        builder.provisional_counts = state['provisional_counts']
+        if 'prefix_digest' in state:
+            builder.prefix_length = int(state['prefix_length'])
+            builder.prefix_digest = str(state['prefix_digest'])
+
+        return builder
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from source.constants import Constants
+from source.preprocessing.activity_count.activity_count_service import ActivityCountService
+from source.preprocessing.preprocessing_runner import PreprocessingRunner
+
+
+class BatchPreprocessingRunner(object):
+    DEFAULT_SUBJECT = '0721'
+
+    @staticmethod
+    def find_sessions(sessions_dir, subject_id=DEFAULT_SUBJECT):
+        # A session is any directory under sessions_dir holding the subject's raw acceleration file,
+        # e.g. data/user_data/<user>/<session>/acceleration/0721_acceleration.npy
+        sessions = []
+        for directory, subdirectories, _ in os.walk(sessions_dir):
+            if os.path.isfile(os.path.join(directory, 'acceleration', subject_id + '_acceleration.npy')):
+                sessions.append((subject_id, directory))
+                subdirectories[:] = []
+            else:
+                subdirectories[:] = [name for name in subdirectories if name != 'outputs']
+                subdirectories.sort()
+        return sessions
+
+    @staticmethod
+    def load_completed(progress_path):
+        completed = set()
+        if progress_path is None or not os.path.exists(progress_path):
+            return completed
+
+        with open(progress_path, 'r') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by an interrupted run
+                if entry.get('status') == 'ok':
+                    completed.add((entry['subject'], entry['data_path']))
+        return completed
+
+    @staticmethod
+    def initialize_worker(force, verbose):
+        # Sessions already run in parallel, so each one builds its features on a single thread
+        Constants.update('FEATURE_BUILDER_WORKERS', 1)
+        Constants.update('VERBOSE', verbose)
+        if force:
+            Constants.update('SKIP_UNCHANGED_STAGES', False)
+
+    @staticmethod
+    def run_session(subject_id, data_path, force=False):
+        start_time = time.perf_counter()
+        try:
+            if force:
+                # Skipping unchanged stages is already off; the incremental count state would still be extended
+                ActivityCountService.remove_state(subject_id, data_path)
+            PreprocessingRunner.run_preprocessing(subject_id, data_path)
+            status, error = 'ok', None
+        except Exception:
+            status, error = 'failed', traceback.format_exc()
+
+        return {'subject': subject_id, 'data_path': data_path, 'status': status,
+                'seconds': time.perf_counter() - start_time, 'error': error}
+
+    @staticmethod
+    def run(sessions, workers=None, progress_path=None, force=False, verbose=False):
+        completed = BatchPreprocessingRunner.load_completed(progress_path)
+        pending = [session for session in sessions if session not in completed]
+        print(f"{len(pending)} of {len(sessions)} sessions to process ({len(sessions) - len(pending)} already done)")
+
+        results = []
+        progress_file = open(progress_path, 'a') if progress_path is not None else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=BatchPreprocessingRunner.initialize_worker,
+                                     initargs=(force, verbose)) as executor:
+                futures = {executor.submit(BatchPreprocessingRunner.run_session, subject_id, data_path, force):
+                           (subject_id, data_path) for subject_id, data_path in pending}
+
+                for future in as_completed(futures):
+                    subject_id, data_path = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:  # The worker process itself died
+                        result = {'subject': subject_id, 'data_path': data_path, 'status': 'failed',
+                                  'seconds': None, 'error': repr(e)}
+                    results.append(result)
+
+                    seconds = 'n/a' if result['seconds'] is None else f"{result['seconds']:.2f} s"
+                    print(f"[{len(results)}/{len(pending)}] {result['status']} {data_path} ({seconds})")
+
+                    if progress_file is not None:
+                        progress_file.write(json.dumps(result) + '\n')
+                        progress_file.flush()
+        finally:
+            if progress_file is not None:
+                progress_file.close()
+
+        failures = [result for result in results if result['status'] != 'ok']
+        print(f"Finished {len(results) - len(failures)} sessions, {len(failures)} failed")
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess many sessions in parallel.")
+    parser.add_argument('--sessions-dir', help="Directory searched for sessions, e.g. data/user_data")
+    parser.add_argument('--subject', default=BatchPreprocessingRunner.DEFAULT_SUBJECT,
+                        help="Subject id used in session file names")
+    parser.add_argument('--subjects', nargs='+', help="Subject ids to process from --data-path instead")
+    parser.add_argument('--data-path', default='data', help="Data directory for --subjects")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--progress', default='outputs/batch_progress.jsonl',
+                        help="JSON lines file of finished sessions; sessions recorded as ok are skipped on rerun")
+    parser.add_argument('--force', action='store_true', help="Rerun every stage even if its inputs are unchanged")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    if args.subjects:
+        sessions = [(subject_id, args.data_path) for subject_id in args.subjects]
+    elif args.sessions_dir:
+        sessions = BatchPreprocessingRunner.find_sessions(args.sessions_dir, args.subject)
+    else:
+        parser.error("one of --sessions-dir or --subjects is required")
+
+    progress_directory = os.path.dirname(args.progress)
+    if progress_directory:
+        os.makedirs(progress_directory, exist_ok=True)
+
+    results = BatchPreprocessingRunner.run(sessions, args.workers, args.progress, args.force, args.verbose)
+    if any(result['status'] != 'ok' for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.preprocessing.batch_preprocessing_runner --sessions-dir data/user_data --workers 8
+    main()
@@ -0,0 +1,68 @@
+import sys
+
+import numpy as np
+
+from source.constants import Constants
+from source.preprocessing.feature_builder import FeatureBuilder
+from source.preprocessing.feature_store import FeatureStore
+from source.preprocessing.preprocessing_runner import PreprocessingRunner
+
+
+class DtypeParityRunner(object):
+    # Largest feature difference allowed, relative to the largest magnitude of that feature in the reference build
+    TOLERANCE = 1e-4
+
+    @staticmethod
+    def run(subject_id, data_path, dtype='float32'):
+        original_dtype = Constants.FEATURE_DTYPE
+
+        try:
+            Constants.update('FEATURE_DTYPE', 'float64')
+            PreprocessingRunner.run_preprocessing(subject_id, data_path)
+            reference = DtypeParityRunner.load_features(subject_id)
+
+            Constants.update('FEATURE_DTYPE', dtype)
+            try:
+                FeatureBuilder.build(subject_id, data_path)
+                candidate = DtypeParityRunner.load_features(subject_id)
+            finally:
+                # Leave the feature file as the configured dtype would have written it
+                Constants.update('FEATURE_DTYPE', original_dtype)
+                FeatureBuilder.build(subject_id, data_path)
+        finally:
+            Constants.update('FEATURE_DTYPE', original_dtype)
+
+        errors = DtypeParityRunner.compare(reference, candidate)
+        for name, error in errors.items():
+            print(name + ': ' + str(candidate[name].dtype) + ', relative error ' + str(error))
+
+        failures = [name for name, error in errors.items() if not error <= DtypeParityRunner.TOLERANCE]
+        if failures:
+            raise ValueError(dtype + " features differ from float64 beyond tolerance: " + ", ".join(failures))
+
+        return errors
+
+    @staticmethod
+    def load_features(subject_id):
+        features = FeatureStore.read(FeatureStore.get_path(subject_id))
+        return {name: np.array(feature) for name, feature in features.items()}
+
+    @staticmethod
+    def compare(reference, candidate):
+        errors = {}
+        for name, reference_feature in reference.items():
+            candidate_feature = candidate[name]
+            if np.shape(reference_feature) != np.shape(candidate_feature):
+                errors[name] = np.inf
+                continue
+
+            scale = np.amax(np.abs(reference_feature)) if np.size(reference_feature) > 0 else 0
+            difference = np.abs(reference_feature - candidate_feature.astype(reference_feature.dtype))
+            maximum_difference = np.amax(difference) if np.size(difference) > 0 else 0
+            errors[name] = maximum_difference / scale if scale > 0 else maximum_difference
+        return errors
+
+
+if __name__ == "__main__":
+    # e.g. python -m source.preprocessing.dtype_parity_runner 0721 data/user_data/0001/20260102_184054
+    DtypeParityRunner.run(sys.argv[1], sys.argv[2])
@@ -0,0 +1,39 @@
+import numpy as np
+
+from source.preprocessing.epoch import Epoch
+
+
+class EpochArray(object):
+    def __init__(self, timestamps, indices):
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.indices = np.asarray(indices, dtype=int)
+
+    def __len__(self):
+        return np.shape(self.timestamps)[0]
+
+    def __getitem__(self, item):
+        if np.isscalar(item):
+            return Epoch(timestamp=self.timestamps[item], index=self.indices[item])
+        return EpochArray(timestamps=self.timestamps[item], indices=self.indices[item])
+
+    def __iter__(self):
+        for timestamp, index in zip(self.timestamps, self.indices):
+            yield Epoch(timestamp=timestamp, index=index)
+
+    def to_epochs(self):
+        return list(self)
+
+    @staticmethod
+    def from_epochs(epochs):
+        if isinstance(epochs, EpochArray):
+            return epochs
+
+        timestamps = [epoch.timestamp for epoch in epochs]
+        indices = [epoch.index for epoch in epochs]
+        return EpochArray(timestamps=timestamps, indices=indices)
+
+    def get_window_bounds(self, timestamps, window_size):
+        # Bounds into sorted timestamps of the open interval (epoch - window_size, epoch + Epoch.DURATION)
+        starts = np.searchsorted(timestamps, self.timestamps - window_size, side='right')
+        ends = np.searchsorted(timestamps, self.timestamps + Epoch.DURATION, side='left')
+        return starts, np.maximum(ends, starts)
@@ -1,12 +1,21 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
 from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_feature_service import ActivityCountFeatureService
 from source.preprocessing.activity_count.activity_count_service import ActivityCountService
+from source.preprocessing.feature_store import FeatureStore
+from source.preprocessing.grid_cache import GridCache
 from source.preprocessing.heart_rate.heart_rate_feature_service import HeartRateFeatureService
 from source.preprocessing.heart_rate.heart_rate_service import HeartRateService
 from source.preprocessing.psg.psg_label_service import PSGLabelService
 from source.preprocessing.psg.psg_service import PSGService
 from source.preprocessing.raw_data_processor import RawDataProcessor
 from source.preprocessing.time.time_based_feature_service import TimeBasedFeatureService
+from source.tracing.memory_profiler import MemoryProfiler
+from source.tracing.tracer import Tracer
 
 
 class FeatureBuilder(object):
@@ -21,14 +30,14 @@ class FeatureBuilder(object):
         activity_count_collection = ActivityCountService.load_cropped(subject_id)
         heart_rate_collection = HeartRateService.load_cropped(subject_id)
 
-        start_time = max(psg_collection.data[0].epoch.timestamp,
+        start_time = max(psg_collection.timestamps[0],
                          activity_count_collection.timestamps[0],
                          heart_rate_collection.timestamps[0])
 
         if Constants.VERBOSE:
             print(f"Global Start Time: {start_time}")
         
-        valid_epochs = [e for e in valid_epochs if e.timestamp - start_time >= ActivityCountFeatureService.WINDOW_SIZE]
+        valid_epochs = valid_epochs[valid_epochs.timestamps - start_time >= ActivityCountFeatureService.WINDOW_SIZE]
 
         original_start_time = PSGService.get_original_start_time(subject_id, data_path)
         if Constants.VERBOSE:
@@ -36,35 +45,104 @@ class FeatureBuilder(object):
 
         if Constants.VERBOSE:
             print("Building features...")
-        FeatureBuilder.build_labels(subject_id, valid_epochs)
-        FeatureBuilder.build_from_wearables(subject_id, valid_epochs)
-        FeatureBuilder.build_from_time(subject_id, valid_epochs, original_start_time)
+        tasks = FeatureBuilder.get_label_tasks(subject_id, valid_epochs) \
+            + FeatureBuilder.get_wearable_tasks(valid_epochs, activity_count_collection, heart_rate_collection) \
+            + FeatureBuilder.get_time_tasks(subject_id, valid_epochs, original_start_time)
+        # Memory stages nest on one stack and tracemalloc peaks are process-wide, so profiled builds run serially
+        workers = 1 if MemoryProfiler.is_enabled() else Constants.FEATURE_BUILDER_WORKERS
+        results, timings = FeatureBuilder.run_tasks(tasks, workers)
+
+        if Constants.VERBOSE:
+            for name, seconds in timings.items():
+                print(f"  {name}: {seconds * 1000:.1f} ms")
+
+        features = {name: results[name] for name, _, _ in tasks if FeatureBuilder.is_feature(name, results)}
+        with Tracer.span('write_features', epochs=len(valid_epochs), columns=len(features)):
+            FeatureStore.write(FeatureStore.get_path(subject_id), features)
+        return timings
 
     @staticmethod
     def build_labels(subject_id, valid_epochs):
-        psg_labels = PSGLabelService.build(subject_id, valid_epochs)
-        PSGLabelService.write(subject_id, psg_labels)
+        results, _ = FeatureBuilder.run_tasks(FeatureBuilder.get_label_tasks(subject_id, valid_epochs), 1)
+        return {FeatureStore.LABELS: results[FeatureStore.LABELS]}
 
     @staticmethod
     def build_from_wearables(subject_id, valid_epochs):
-
-        count_feature = ActivityCountFeatureService.build(subject_id, valid_epochs)
-        heart_rate_feature = HeartRateFeatureService.build(subject_id, valid_epochs)
-        hr_mean_raw_feature, hr_mean_normalized_feature = HeartRateFeatureService.build_mean(subject_id, valid_epochs)
-        ActivityCountFeatureService.write(subject_id, count_feature)
-        HeartRateFeatureService.write(subject_id, heart_rate_feature)
-        # HeartRateFeatureService.write_mean_raw(subject_id, hr_mean_raw_feature)
-        HeartRateFeatureService.write_mean_normalized(subject_id, hr_mean_normalized_feature)
+        tasks = FeatureBuilder.get_wearable_tasks(valid_epochs, ActivityCountService.load_cropped(subject_id),
+                                                  HeartRateService.load_cropped(subject_id))
+        results, _ = FeatureBuilder.run_tasks(tasks, Constants.FEATURE_BUILDER_WORKERS)
+        return {name: results[name] for name, _, _ in tasks if FeatureBuilder.is_feature(name, results)}
 
     @staticmethod
     def build_from_time(subject_id, valid_epochs, start_time=None):
+        tasks = FeatureBuilder.get_time_tasks(subject_id, valid_epochs, start_time)
+        results, _ = FeatureBuilder.run_tasks(tasks, Constants.FEATURE_BUILDER_WORKERS)
+        return {name: results[name] for name, _, _ in tasks if FeatureBuilder.is_feature(name, results)}
+
+    @staticmethod
+    def is_feature(name, results):
+        return not name.startswith('_') and results[name] is not None
+
+    # Each task is (name, dependencies, function), listed after its dependencies. Names starting with an underscore
+    # are intermediate steps that fill the shared grid cache and are not written to the feature store.
+    @staticmethod
+    def get_label_tasks(subject_id, valid_epochs):
+        return [(FeatureStore.LABELS, [], lambda: PSGLabelService.build(subject_id, valid_epochs))]
+
+    @staticmethod
+    def get_wearable_tasks(valid_epochs, activity_count_collection, heart_rate_collection):
+        grid_cache = GridCache()
+
+        return [('_count_grid', [],
+                 lambda: ActivityCountFeatureService.interpolate(activity_count_collection, grid_cache)),
+                ('_heart_rate_grid', [],
+                 lambda: HeartRateFeatureService.interpolate_raw(heart_rate_collection, grid_cache)),
+                ('_heart_rate_normalized', ['_heart_rate_grid'],
+                 lambda: HeartRateFeatureService.interpolate_and_normalize(heart_rate_collection, grid_cache)),
+                (FeatureStore.COUNT, ['_count_grid'],
+                 lambda: ActivityCountFeatureService.build_from_collection(activity_count_collection, valid_epochs,
+                                                                           grid_cache)),
+                (FeatureStore.HR_STD, ['_heart_rate_normalized'],
+                 lambda: HeartRateFeatureService.build_from_collection(heart_rate_collection, valid_epochs,
+                                                                       grid_cache)),
+                (FeatureStore.HR_MEAN, ['_heart_rate_grid'],
+                 lambda: HeartRateFeatureService.build_mean_from_collection(heart_rate_collection, valid_epochs,
+                                                                            grid_cache)[1])]
+
+    @staticmethod
+    def get_time_tasks(subject_id, valid_epochs, start_time=None):
+        tasks = []
 
         if Constants.INCLUDE_CIRCADIAN:
-            circadian_feature = TimeBasedFeatureService.build_circadian_model(subject_id, valid_epochs)
-            TimeBasedFeatureService.write_circadian_model(subject_id, circadian_feature)
+            tasks.append((FeatureStore.CIRCADIAN, [],
+                          lambda: TimeBasedFeatureService.build_circadian_model(subject_id, valid_epochs)))
+
+        tasks.append((FeatureStore.COSINE, [], lambda: TimeBasedFeatureService.build_cosine(valid_epochs, start_time)))
+        tasks.append((FeatureStore.TIME, [], lambda: TimeBasedFeatureService.build_time(valid_epochs, start_time)))
+        return tasks
+
+    @staticmethod
+    def run_tasks(tasks, workers):
+        # Tasks are submitted in order, so a task waiting on its dependencies never holds a worker they still need
+        futures = {}
+        timings = {}
+        parent = Tracer.current()
+
+        def run(name, dependencies, function):
+            for dependency in dependencies:
+                futures[dependency].result()
+
+            with Tracer.span(name, parent=parent) as span, MemoryProfiler.stage(name):
+                task_start = time.perf_counter()
+                result = function()
+                timings[name] = time.perf_counter() - task_start
+                if isinstance(result, np.ndarray):
+                    span.set('shape', np.shape(result))
+            return result
 
-        cosine_feature = TimeBasedFeatureService.build_cosine(valid_epochs, start_time)
-        time_feature = TimeBasedFeatureService.build_time(valid_epochs, start_time)
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='feature-builder') as executor:
+            for name, dependencies, function in tasks:
+                futures[name] = executor.submit(run, name, dependencies, function)
 
-        TimeBasedFeatureService.write_cosine(subject_id, cosine_feature)
-        TimeBasedFeatureService.write_time(subject_id, time_feature)
+        results = {name: future.result() for name, future in futures.items()}
+        return results, {name: timings[name] for name, _, _ in tasks}
@@ -0,0 +1,134 @@
+import json
+import os
+import struct
+
+import numpy as np
+
+from source.constants import Constants
+
+
+class FeatureStore(object):
+    # One file per session: a JSON header naming the columns, then each column stored contiguously with room for
+    # `capacity` epochs. Columns are read as memory-mapped views and new epochs are appended in place until the
+    # capacity runs out, at which point the file is rewritten with double the capacity.
+    MAGIC = b'FEATSTR1'
+    HEADER_ALIGNMENT = 64
+    HEADER_GROWTH_BYTES = 32  # Spare room so the header can be rewritten in place as the length grows
+
+    LABELS = 'psg_labels'
+    COUNT = 'count'
+    HR_STD = 'hr_std'
+    HR_MEAN = 'hr_mean'
+    CIRCADIAN = 'circadian'
+    COSINE = 'cosine'
+    TIME = 'time'
+
+    @staticmethod
+    def get_path(subject_id):
+        return Constants.FEATURE_FILE_PATH.joinpath(subject_id + '_features.dat')
+
+    @staticmethod
+    def get_path_for_session(session_dir, subject_id):
+        return os.path.join(session_dir, 'outputs', 'features', subject_id + '_features.dat')
+
+    @staticmethod
+    def write(path, features, capacity=None):
+        columns = list(features.keys())
+        values = [np.ravel(features[column]) for column in columns]
+        length = np.shape(values[0])[0] if values else 0
+        if any(np.shape(column_values)[0] != length for column_values in values):
+            raise ValueError("Feature columns must all have the same number of epochs")
+
+        capacity = length if capacity is None else max(capacity, length)
+        header = {'columns': columns, 'dtype': np.dtype(Constants.FEATURE_DTYPE).str,
+                  'length': length, 'capacity': capacity}
+
+        # Written next to the target and swapped in so readers never see a partial file
+        temporary_path = str(path) + '.tmp'
+        with open(temporary_path, 'wb') as file:
+            offset = FeatureStore.write_header(file, header)
+            data = np.zeros((len(columns), capacity), dtype=header['dtype'])
+            for index, column_values in enumerate(values):
+                data[index, :length] = column_values
+            file.seek(offset)
+            file.write(data.tobytes())
+        os.replace(temporary_path, str(path))
+
+    @staticmethod
+    def read(path, columns=None):
+        with open(str(path), 'rb') as file:
+            header, offset = FeatureStore.read_header(file)
+            data = FeatureStore.map_columns(file, header, offset, 'r')
+
+        if columns is None:
+            columns = header['columns']
+        features = {}
+        for column in columns:
+            features[column] = data[header['columns'].index(column), :header['length']]
+        return features
+
+    @staticmethod
+    def append(path, features):
+        if not os.path.exists(str(path)):
+            FeatureStore.write(path, features)
+            return
+
+        with open(str(path), 'r+b') as file:
+            header, offset = FeatureStore.read_header(file)
+            if list(features.keys()) != header['columns']:
+                raise ValueError("Appended columns " + str(list(features.keys())) + " do not match stored columns " +
+                                 str(header['columns']))
+
+            values = [np.ravel(features[column]) for column in header['columns']]
+            start = header['length']
+            end = start + np.shape(values[0])[0]
+
+            if end <= header['capacity']:
+                data = FeatureStore.map_columns(file, header, offset, 'r+')
+                for index, column_values in enumerate(values):
+                    data[index, start:end] = column_values
+                data.flush()
+
+                header['length'] = end
+                FeatureStore.write_header(file, header, offset)
+                return
+
+            stored = FeatureStore.map_columns(file, header, offset, 'r')
+            combined = {column: np.concatenate((stored[index, :start], values[index]))
+                        for index, column in enumerate(header['columns'])}
+
+        FeatureStore.write(path, combined, capacity=max(2 * header['capacity'], end))
+
+    @staticmethod
+    def map_columns(file, header, offset, mode):
+        shape = (len(header['columns']), header['capacity'])
+        if shape[0] * shape[1] == 0:
+            return np.zeros(shape, dtype=header['dtype'])
+        return np.memmap(file, dtype=header['dtype'], mode=mode, offset=offset, shape=shape)
+
+    @staticmethod
+    def write_header(file, header, offset=None):
+        encoded = json.dumps(header).encode('utf-8')
+        prefix_length = len(FeatureStore.MAGIC) + 4
+
+        if offset is None:
+            minimum_length = prefix_length + len(encoded) + FeatureStore.HEADER_GROWTH_BYTES
+            offset = -(-minimum_length // FeatureStore.HEADER_ALIGNMENT) * FeatureStore.HEADER_ALIGNMENT
+        elif prefix_length + len(encoded) > offset:
+            raise ValueError("Feature store header no longer fits in place")
+
+        file.seek(0)
+        file.write(FeatureStore.MAGIC)
+        file.write(struct.pack('<I', offset))
+        file.write(encoded.ljust(offset - prefix_length))
+        return offset
+
+    @staticmethod
+    def read_header(file):
+        file.seek(0)
+        if file.read(len(FeatureStore.MAGIC)) != FeatureStore.MAGIC:
+            raise ValueError("Not a feature store file: " + str(file.name))
+
+        offset = struct.unpack('<I', file.read(4))[0]
+        header = json.loads(file.read(offset - len(FeatureStore.MAGIC) - 4).decode('utf-8'))
+        return header, offset
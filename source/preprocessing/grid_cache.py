@@ -0,0 +1,33 @@
+import numpy as np
+
+from source.constants import Constants
+
+
+class GridCache(object):
+    def __init__(self):
+        self.grids = {}
+        self.derived = {}
+
+    def get_grid(self, name, collection):
+        if name not in self.grids:
+            self.grids[name] = GridCache.interpolate(collection)
+        return self.grids[name]
+
+    def get_derived(self, name, key, builder):
+        derived_key = (name, key)
+        if derived_key not in self.derived:
+            self.derived[derived_key] = builder()
+        return self.derived[derived_key]
+
+    def clear(self):
+        self.grids.clear()
+        self.derived.clear()
+
+    @staticmethod
+    def interpolate(collection):
+        timestamps = collection.timestamps.flatten()
+        values = collection.values.flatten()
+        interpolated_timestamps = np.arange(np.amin(timestamps),
+                                            np.amax(timestamps), 1)
+        interpolated_values = np.interp(interpolated_timestamps, timestamps, values)
+        return interpolated_timestamps, interpolated_values.astype(Constants.FEATURE_DTYPE, copy=False)
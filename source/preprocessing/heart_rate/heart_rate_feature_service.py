@@ -4,11 +4,14 @@ import pandas as pd
 from source import utils
 from source.constants import Constants
 from source.preprocessing.epoch import Epoch
+from source.preprocessing.epoch_array import EpochArray
+from source.preprocessing.grid_cache import GridCache
 from source.preprocessing.heart_rate.heart_rate_service import HeartRateService
 
 
 class HeartRateFeatureService(object):
     WINDOW_SIZE = 10 * 30 - 15
+    GRID_NAME = 'heart_rate'
 
     @staticmethod
     def load(subject_id):
@@ -44,64 +47,49 @@ class HeartRateFeatureService(object):
         np.save(mean_feature_path, feature)
 
     @staticmethod
-    def build(subject_id, valid_epochs):
+    def build(subject_id, valid_epochs, grid_cache=None):
         heart_rate_collection = HeartRateService.load_cropped(subject_id)
-        return HeartRateFeatureService.build_from_collection(heart_rate_collection, valid_epochs)
+        return HeartRateFeatureService.build_from_collection(heart_rate_collection, valid_epochs, grid_cache)
 
     @staticmethod
-    def build_mean(subject_id, valid_epochs):
+    def build_mean(subject_id, valid_epochs, grid_cache=None):
         heart_rate_collection = HeartRateService.load_cropped(subject_id)
-        return HeartRateFeatureService.build_mean_from_collection(heart_rate_collection, valid_epochs)
+        return HeartRateFeatureService.build_mean_from_collection(heart_rate_collection, valid_epochs, grid_cache)
 
     @staticmethod
-    def build_from_collection(heart_rate_collection, valid_epochs):
-        heart_rate_features = []
+    def build_from_collection(heart_rate_collection, valid_epochs, grid_cache=None):
+        valid_epochs = EpochArray.from_epochs(valid_epochs)
 
         interpolated_timestamps, interpolated_hr = HeartRateFeatureService.interpolate_and_normalize(
-            heart_rate_collection)
+            heart_rate_collection, grid_cache)
 
         min_timestamp = np.amin(interpolated_timestamps)
+        valid_epochs = valid_epochs[valid_epochs.timestamps - min_timestamp >= HeartRateFeatureService.WINDOW_SIZE]
 
-        for epoch in valid_epochs:
-            if epoch.timestamp - min_timestamp < HeartRateFeatureService.WINDOW_SIZE:
-                continue
-
-            indices_in_range = HeartRateFeatureService.get_window(interpolated_timestamps, epoch)
-            heart_rate_values_in_range = interpolated_hr[indices_in_range]
-
-            feature = HeartRateFeatureService.get_feature(heart_rate_values_in_range)
-
-            heart_rate_features.append(feature)
-
-        return np.array(heart_rate_features)
+        starts, ends = valid_epochs.get_window_bounds(interpolated_timestamps, HeartRateFeatureService.WINDOW_SIZE)
+        return utils.apply_to_windows(interpolated_hr, starts, ends, HeartRateFeatureService.get_features)
 
     @staticmethod
-    def build_mean_from_collection(heart_rate_collection, valid_epochs):
-        raw_mean_features = []
-        normalized_mean_features = []
+    def build_mean_from_collection(heart_rate_collection, valid_epochs, grid_cache=None):
+        if grid_cache is None:
+            grid_cache = GridCache()
+
+        valid_epochs = EpochArray.from_epochs(valid_epochs)
 
-        raw_timestamps, raw_hr = HeartRateFeatureService.interpolate_raw(heart_rate_collection)
+        raw_timestamps, raw_hr = HeartRateFeatureService.interpolate_raw(heart_rate_collection, grid_cache)
 
-        scalar = np.percentile(np.abs(raw_hr), 90)
+        scalar = grid_cache.get_derived(HeartRateFeatureService.GRID_NAME, 'raw_percentile_90',
+                                        lambda: np.percentile(np.abs(raw_hr), 90))
         if scalar == 0:
             scalar = 1.0
 
         min_timestamp = np.amin(raw_timestamps)
+        valid_epochs = valid_epochs[valid_epochs.timestamps - min_timestamp >= HeartRateFeatureService.WINDOW_SIZE]
 
-        for epoch in valid_epochs:
-            if epoch.timestamp - min_timestamp < HeartRateFeatureService.WINDOW_SIZE:
-                continue
-
-            indices_in_range = HeartRateFeatureService.get_window(raw_timestamps, epoch)
-            hr_values_in_range = raw_hr[indices_in_range]
+        starts, ends = valid_epochs.get_window_bounds(raw_timestamps, HeartRateFeatureService.WINDOW_SIZE)
+        raw_mean_features = utils.apply_to_windows(raw_hr, starts, ends, lambda windows: np.mean(windows, axis=1))
 
-            raw_mean = np.mean(hr_values_in_range)
-            normalized_mean = raw_mean / scalar
-
-            raw_mean_features.append(raw_mean)
-            normalized_mean_features.append(normalized_mean)
-
-        return np.array(raw_mean_features), np.array(normalized_mean_features)
+        return raw_mean_features, raw_mean_features / scalar
 
     @staticmethod
     def get_window(timestamps, epoch):
@@ -120,26 +108,31 @@ class HeartRateFeatureService(object):
         # return [np.std(heart_rate_values), np.mean(heart_rate_values)]
 
     @staticmethod
-    def interpolate_and_normalize(heart_rate_collection):
-        timestamps = heart_rate_collection.timestamps.flatten()
-        heart_rate_values = heart_rate_collection.values.flatten()
-        interpolated_timestamps = np.arange(np.amin(timestamps),
-                                            np.amax(timestamps), 1)
-        interpolated_hr = np.interp(interpolated_timestamps, timestamps, heart_rate_values)
+    def get_features(heart_rate_windows):
+        return np.std(heart_rate_windows, axis=1)
+
+    @staticmethod
+    def interpolate_and_normalize(heart_rate_collection, grid_cache=None):
+        if grid_cache is None:
+            grid_cache = GridCache()
+
+        interpolated_timestamps, interpolated_hr = HeartRateFeatureService.interpolate_raw(heart_rate_collection,
+                                                                                           grid_cache)
 
-        interpolated_hr = utils.convolve_with_dog(interpolated_hr, HeartRateFeatureService.WINDOW_SIZE)
+        filtered_hr = grid_cache.get_derived(HeartRateFeatureService.GRID_NAME, 'dog_filtered',
+                                             lambda: utils.convolve_with_dog(interpolated_hr,
+                                                                             HeartRateFeatureService.WINDOW_SIZE))
 
-        scalar = np.percentile(np.abs(interpolated_hr), 90)
-        interpolated_hr = interpolated_hr / scalar
+        scalar = grid_cache.get_derived(HeartRateFeatureService.GRID_NAME, 'dog_percentile_90',
+                                        lambda: np.percentile(np.abs(filtered_hr), 90))
+        normalized_hr = grid_cache.get_derived(HeartRateFeatureService.GRID_NAME, 'dog_normalized',
+                                               lambda: filtered_hr / scalar)
 
-        return interpolated_timestamps, interpolated_hr
+        return interpolated_timestamps, normalized_hr
 
     @staticmethod
-    def interpolate_raw(heart_rate_collection):
-        timestamps = heart_rate_collection.timestamps.flatten()
-        heart_rate_values = heart_rate_collection.values.flatten()
-        interpolated_timestamps = np.arange(np.amin(timestamps),
-                                            np.amax(timestamps), 1)
-        interpolated_hr = np.interp(interpolated_timestamps, timestamps, heart_rate_values)
+    def interpolate_raw(heart_rate_collection, grid_cache=None):
+        if grid_cache is None:
+            grid_cache = GridCache()
 
-        return interpolated_timestamps, interpolated_hr
+        return grid_cache.get_grid(HeartRateFeatureService.GRID_NAME, heart_rate_collection)
@@ -4,16 +4,20 @@ import pandas as pd
 from source import utils
 from source.constants import Constants
 from source.preprocessing.heart_rate.heart_rate_collection import HeartRateCollection
+from source.tracing.tracer import Tracer
 
 
 class HeartRateService(object):
 
     @staticmethod
     def load_raw(subject_id, data_path):
-        raw_hr_path = HeartRateService.get_raw_file_path(subject_id, data_path)
-        heart_rate_array = np.load(str(raw_hr_path))
-        heart_rate_array = utils.remove_repeats(heart_rate_array)
-        return HeartRateCollection(subject_id=subject_id, data=heart_rate_array)
+        with Tracer.span('load_raw', source='heart_rate') as span:
+            raw_hr_path = HeartRateService.get_raw_file_path(subject_id, data_path)
+            heart_rate_array = np.load(str(raw_hr_path), mmap_mode='r')
+            all_columns = list(range(np.shape(heart_rate_array)[1]))
+            heart_rate_array = utils.remove_repeats_from_columns(heart_rate_array, all_columns)
+            span.set('shape', np.shape(heart_rate_array))
+            return HeartRateCollection(subject_id=subject_id, data=heart_rate_array)
 
     @staticmethod
     def load_cropped(subject_id):
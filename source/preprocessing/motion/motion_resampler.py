@@ -0,0 +1,97 @@
+from fractions import Fraction
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from source.preprocessing.motion.resampling_mode import ResamplingMode
+
+
+class MotionResampler(object):
+    # Puts motion on the 50 Hz count grid for the whole-night count path (build_counts). The incremental count
+    # builder always interpolates, so uniform and polyphase resampling only apply with INCREMENTAL_ACTIVITY_COUNTS off.
+    MAX_JITTER = 0.25  # Largest distance of a sample from its slot on a uniform grid, in sample periods
+    MAX_DENOMINATOR = 50
+    BLOCK_LENGTH = 1 << 16  # Samples scanned at a time by detect, so it never allocates night-length arrays
+
+    def __init__(self, timestamps, values, fs):
+        # Column views of memory-mapped motion are kept as they are; only chunks of them are read at a time
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.fs = fs
+
+        self.start_time = np.amin(self.timestamps)
+        step = 1.0 / fs
+        self.spacing = (self.start_time + step) - self.start_time  # Same spacing np.arange uses
+
+        self.mode, self.native_rate, self.jitter, self.up, self.down = MotionResampler.detect(self.timestamps, fs)
+
+        # Every mode fills the np.arange(start, end, step) grid the interpolating path has always used, so the
+        # number of counts does not depend on the mode
+        number_of_inputs = np.shape(self.values)[0]
+        self.length = int(np.ceil((np.amax(self.timestamps) - self.start_time) / step))
+        if self.mode == ResamplingMode.uniform:
+            self.length = min(self.length, number_of_inputs)
+        elif self.mode == ResamplingMode.polyphase:
+            self.length = min(self.length, int(np.ceil(number_of_inputs * self.up / self.down)))
+
+    @staticmethod
+    def detect(timestamps, fs):
+        number_of_inputs = np.shape(timestamps)[0]
+        if number_of_inputs < 3:
+            return ResamplingMode.interpolate, None, None, 1, 1
+
+        native_period = (timestamps[-1] - timestamps[0]) / (number_of_inputs - 1)
+        if native_period <= 0:
+            return ResamplingMode.interpolate, None, None, 1, 1
+
+        # Gaps, bursts and clock drift all show up as samples far from their slot on the native grid
+        largest_offset = 0.0
+        for block_start in range(0, number_of_inputs, MotionResampler.BLOCK_LENGTH):
+            block_end = min(block_start + MotionResampler.BLOCK_LENGTH, number_of_inputs)
+            slot_offsets = timestamps[block_start:block_end] - timestamps[0] - \
+                np.arange(block_start, block_end) * native_period
+            largest_offset = max(largest_offset, np.amax(np.abs(slot_offsets)))
+        jitter = largest_offset / native_period
+        native_rate = 1.0 / native_period
+        if jitter > MotionResampler.MAX_JITTER:
+            return ResamplingMode.interpolate, native_rate, jitter, 1, 1
+
+        # A rational approximation of the rate ratio is only usable if the error it accumulates over the whole
+        # recording stays within the jitter budget
+        ratio = fs * native_period
+        fraction = Fraction(ratio).limit_denominator(MotionResampler.MAX_DENOMINATOR)
+        accumulated_error = abs(fraction.numerator / fraction.denominator - ratio) / ratio * number_of_inputs
+        if accumulated_error > MotionResampler.MAX_JITTER:
+            return ResamplingMode.interpolate, native_rate, jitter, 1, 1
+
+        if fraction == 1:
+            return ResamplingMode.uniform, native_rate, jitter, 1, 1
+
+        return ResamplingMode.polyphase, native_rate, jitter, fraction.numerator, fraction.denominator
+
+    def get_values(self, grid_start, grid_end):
+        if self.mode == ResamplingMode.uniform:
+            return self.values[grid_start:grid_end]
+
+        if self.mode == ResamplingMode.polyphase:
+            return self.get_polyphase_values(grid_start, grid_end)
+
+        time = self.start_time + np.arange(grid_start, grid_end) * self.spacing
+        source_start = max(np.searchsorted(self.timestamps, time[0], side='right') - 1, 0)
+        source_end = np.searchsorted(self.timestamps, time[-1], side='left') + 1
+        return np.interp(time, self.timestamps[source_start:source_end], self.values[source_start:source_end])
+
+    def get_polyphase_values(self, grid_start, grid_end):
+        # Slices start on a multiple of down so their output lands on the whole-signal output grid, with a margin
+        # of the anti-aliasing filter's half length on both sides
+        up = self.up
+        down = self.down
+        margin = 20 * max(up, down) // up + down
+
+        input_start = max(grid_start * down // up - margin, 0)
+        input_start -= input_start % down
+        input_end = min(int(np.ceil(grid_end * down / up)) + margin, np.shape(self.values)[0])
+
+        resampled = resample_poly(self.values[input_start:input_end], up, down, padtype='line')
+        offset = input_start * up // down
+        return resampled[grid_start - offset:grid_end - offset]
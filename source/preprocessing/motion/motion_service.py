@@ -4,21 +4,30 @@ import pandas as pd
 from source import utils
 from source.constants import Constants
 from source.preprocessing.motion.motion_collection import MotionCollection
+from source.tracing.tracer import Tracer
 
 
 class MotionService(object):
+    TIMESTAMP_COLUMN = 0
+    Z_COLUMN = 3
+    COUNT_COLUMNS = [TIMESTAMP_COLUMN, Z_COLUMN]  # All the activity count path reads
 
     @staticmethod
-    def load_raw(subject_id, data_path):
-        raw_motion_path = MotionService.get_raw_file_path(subject_id, data_path)
-        motion_array = np.load(str(raw_motion_path))
-        motion_array = utils.remove_repeats(motion_array)
-        return MotionCollection(subject_id=subject_id, data=motion_array)
+    def load_raw(subject_id, data_path, columns=None):
+        with Tracer.span('load_raw', source='motion') as span:
+            raw_motion_path = MotionService.get_raw_file_path(subject_id, data_path)
+            motion_array = np.load(str(raw_motion_path), mmap_mode='r')
+            if columns is None:
+                columns = list(range(np.shape(motion_array)[1]))
+
+            motion_array = utils.remove_repeats_from_columns(motion_array, columns)
+            span.set('shape', np.shape(motion_array))
+            return MotionCollection(subject_id=subject_id, data=motion_array)
 
     @staticmethod
     def load_cropped(subject_id):
         cropped_motion_path = MotionService.get_cropped_file_path(subject_id)
-        motion_array = np.load(str(cropped_motion_path))
+        motion_array = np.load(str(cropped_motion_path), mmap_mode='r')
         return MotionCollection(subject_id=subject_id, data=motion_array)
 
     @staticmethod
@@ -29,16 +38,17 @@ class MotionService(object):
     @staticmethod
     def write(motion_collection):
         motion_output_path = MotionService.get_cropped_file_path(motion_collection.subject_id)
-        np.save(motion_output_path, motion_collection.data)
+        np.save(motion_output_path, np.asfortranarray(motion_collection.data))  # Column-major, so columns map alone
 
     @staticmethod
     def crop(motion_collection, interval):
+        # Timestamps are sorted by load_raw, so the interval is a contiguous slice and cropping copies nothing
         subject_id = motion_collection.subject_id
         timestamps = motion_collection.timestamps
-        valid_indices = ((timestamps >= interval.start_time)
-                         & (timestamps < interval.end_time)).nonzero()[0]
+        start_index = np.searchsorted(timestamps, interval.start_time, side='left')
+        end_index = np.searchsorted(timestamps, interval.end_time, side='left')
 
-        cropped_data = motion_collection.data[valid_indices, :]
+        cropped_data = motion_collection.data[start_index:end_index, :]
         return MotionCollection(subject_id=subject_id, data=cropped_data)
 
     @staticmethod
@@ -0,0 +1,7 @@
+from enum import Enum
+
+
+class ResamplingMode(Enum):
+    interpolate = 0
+    uniform = 1
+    polyphase = 2
@@ -2,19 +2,59 @@ import time
 import os
 from pathlib import Path
 
-from source.analysis.figures.data_plot_builder import DataPlotBuilder
-from source.analysis.setup.subject_builder import SubjectBuilder
 from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_service import ActivityCountService
 from source.preprocessing.feature_builder import FeatureBuilder
+from source.preprocessing.feature_store import FeatureStore
+from source.preprocessing.heart_rate.heart_rate_service import HeartRateService
+from source.preprocessing.motion.motion_service import MotionService
+from source.preprocessing.psg.psg_service import PSGService
 from source.preprocessing.raw_data_processor import RawDataProcessor
+from source.preprocessing.stage_cache import StageCache
 from source.preprocessing.time.circadian_service import CircadianService
+from source.tracing.memory_profiler import MemoryProfiler
+from source.tracing.tracer import Tracer
 
 class PreprocessingRunner:
     @staticmethod
     def run_preprocessing(subject, data_path):
         start_time = time.time()
-        
+
+        # A caller that already started a trace (e.g. a benchmark) keeps it and collects these spans too
+        owns_trace = Constants.TRACING and not Tracer.is_enabled()
+        if owns_trace:
+            Tracer.start()
+        owns_memory_profile = Constants.MEMORY_PROFILING and not MemoryProfiler.is_enabled()
+        if owns_memory_profile:
+            MemoryProfiler.start()
+
+        try:
+            with Tracer.span('run_preprocessing', subject=subject, data_path=str(data_path)), \
+                    MemoryProfiler.stage('run_preprocessing', subject=subject):
+                PreprocessingRunner.run_stages(subject, data_path)
+        finally:
+            trace = Tracer.stop() if owns_trace else None
+            memory_profile = MemoryProfiler.stop() if owns_memory_profile else None
+
+        if trace is not None:
+            trace.write_json_lines(PreprocessingRunner.get_trace_path(subject, data_path))
+        if memory_profile is not None:
+            memory_profile.write_json(PreprocessingRunner.get_memory_profile_path(subject, data_path))
+
+        end_time = time.time()
+        print("Execution took " + str(end_time - start_time) + " seconds")
+        return trace
+
+    @staticmethod
+    def get_trace_path(subject, data_path):
+        return os.path.join(data_path, 'outputs', subject + '_trace.jsonl')
+
+    @staticmethod
+    def get_memory_profile_path(subject, data_path):
+        return os.path.join(data_path, 'outputs', subject + '_memory.json')
+
+    @staticmethod
+    def run_stages(subject, data_path):
         cropped_path = os.path.join(data_path, 'outputs/cropped/')
         features_path = os.path.join(data_path, 'outputs/features/')
 
@@ -24,20 +64,64 @@ class PreprocessingRunner:
         Constants.update('CROPPED_FILE_PATH', Path(cropped_path))
         Constants.update('FEATURE_FILE_PATH', Path(features_path))
 
-        print("Cropping data from subject " + str(subject) + "...")
-        RawDataProcessor.crop_all(subject, data_path)
+        stage_cache = StageCache(StageCache.get_manifest_path(data_path, subject))
+
+        with Tracer.span('crop') as span, MemoryProfiler.stage('crop'):
+            crop_key = stage_cache.get_key(StageCache.CROP,
+                                           [PSGService.get_precleaned_file_path(subject, data_path),
+                                            MotionService.get_raw_file_path(subject, data_path),
+                                            HeartRateService.get_raw_file_path(subject, data_path)],
+                                           {'motion_columns': MotionService.COUNT_COLUMNS})
+            is_current = stage_cache.is_current(StageCache.CROP, crop_key,
+                                                [PSGService.get_cropped_file_path(subject),
+                                                 MotionService.get_cropped_file_path(subject),
+                                                 HeartRateService.get_cropped_file_path(subject)])
+            span.set('cached', is_current)
+            if is_current:
+                print("Cropped data for subject " + str(subject) + " is up to date")
+            else:
+                print("Cropping data from subject " + str(subject) + "...")
+                with Tracer.span('crop_all', subject=subject):
+                    RawDataProcessor.crop(subject, data_path)
+                stage_cache.record(StageCache.CROP, crop_key)
+
+        with Tracer.span('counts') as span, MemoryProfiler.stage('counts'):
+            counts_key = stage_cache.get_key(StageCache.COUNTS, [MotionService.get_cropped_file_path(subject)],
+                                             {'incremental': Constants.INCREMENTAL_ACTIVITY_COUNTS,
+                                              'sampling_frequency': ActivityCountService.SAMPLING_FREQUENCY,
+                                              'epoch': ActivityCountService.COUNT_EPOCH_IN_SECONDS})
+            is_current = stage_cache.is_current(StageCache.COUNTS, counts_key,
+                                                [ActivityCountService.get_cropped_file_path(subject)])
+            span.set('cached', is_current)
+            if is_current:
+                print("Activity counts for subject " + str(subject) + " are up to date")
+            else:
+                RawDataProcessor.build_activity_counts(subject)
+                stage_cache.record(StageCache.COUNTS, counts_key)
 
         if Constants.INCLUDE_CIRCADIAN:
             ActivityCountService.build_activity_counts()  # This uses MATLAB, but has been replaced with a python implementation
             CircadianService.build_circadian_model()      # Both of the circadian lines require MATLAB to run
             CircadianService.build_circadian_mesa()       # INCLUDE_CIRCADIAN = False by default because most people don't have MATLAB
 
-        
-        FeatureBuilder.build(subject, data_path)
-
-        end_time = time.time()
-        print("Execution took " + str(end_time - start_time) + " seconds")
+        with Tracer.span('features') as span, MemoryProfiler.stage('features'):
+            features_key = stage_cache.get_key(StageCache.FEATURES,
+                                               [PSGService.get_precleaned_file_path(subject, data_path),
+                                                PSGService.get_cropped_file_path(subject),
+                                                MotionService.get_cropped_file_path(subject),
+                                                HeartRateService.get_cropped_file_path(subject),
+                                                ActivityCountService.get_cropped_file_path(subject)],
+                                               {'dtype': Constants.FEATURE_DTYPE,
+                                                'include_circadian': Constants.INCLUDE_CIRCADIAN})
+            is_current = stage_cache.is_current(StageCache.FEATURES, features_key, [FeatureStore.get_path(subject)])
+            span.set('cached', is_current)
+            if is_current:
+                print("Features for subject " + str(subject) + " are up to date")
+            else:
+                FeatureBuilder.build(subject, data_path)
+                stage_cache.record(StageCache.FEATURES, features_key)
 
+        stage_cache.save()
 
 # subject_ids = SubjectBuilder.get_all_subject_ids()
 # PreprocessingRunner.run_preprocessing('893', 'data/user_data/0001/20260102_184054')
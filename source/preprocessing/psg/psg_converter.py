@@ -1,3 +1,5 @@
+import numpy as np
+
 from source.sleep_stage import SleepStage
 
 
@@ -26,6 +28,16 @@ class PSGConverter(object):
         5: SleepStage.rem,
         6: SleepStage.unscored}
 
+    # Lookup table from stored integer scores to SleepStage values, indexed by score + 1
+    ints_to_values = np.array([SleepStage.unscored.value,
+                               SleepStage.wake.value,
+                               SleepStage.n1.value,
+                               SleepStage.n2.value,
+                               SleepStage.n3.value,
+                               SleepStage.n4.value,
+                               SleepStage.rem.value,
+                               SleepStage.unscored.value])
+
     @staticmethod
     def get_label_from_string(stage_string):
         if stage_string in PSGConverter.strings_to_labels:
@@ -35,3 +47,13 @@ class PSGConverter(object):
     def get_label_from_int(stage_int):
         if stage_int in PSGConverter.ints_to_labels:
             return PSGConverter.ints_to_labels[stage_int]
+
+    @staticmethod
+    def get_values_from_ints(stage_ints):
+        stage_ints = np.asarray(stage_ints).astype(int)
+        table_indices = stage_ints + 1
+        in_table = (table_indices >= 0) & (table_indices < np.shape(PSGConverter.ints_to_values)[0])
+
+        values = np.full(np.shape(stage_ints), SleepStage.unscored.value)
+        values[in_table] = PSGConverter.ints_to_values[table_indices[in_table]]
+        return values
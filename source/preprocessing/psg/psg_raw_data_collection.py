@@ -1,35 +1,43 @@
 import numpy as np
 
+from source.preprocessing.epoch import Epoch
 from source.preprocessing.interval import Interval
+from source.preprocessing.psg.stage_item import StageItem
 from source.sleep_stage import SleepStage
 
 
 class PSGRawDataCollection(object):
-    def __init__(self, subject_id, data: [SleepStage]):
+    def __init__(self, subject_id, data: [StageItem] = None, timestamps=None, stages=None, indices=None):
         self.subject_id = subject_id
-        self.data = data
+        self.stage_items = data
+
+        if data is not None:
+            timestamps = [stage_item.epoch.timestamp for stage_item in data]
+            stages = [stage_item.stage.value for stage_item in data]
+            indices = [stage_item.epoch.index for stage_item in data]
+
+        self.timestamps = np.asarray(timestamps)
+        self.stages = np.asarray(stages, dtype=int)
+        if indices is None:
+            indices = np.arange(np.shape(self.timestamps)[0])
+        self.indices = np.asarray(indices, dtype=int)
+
+    @property
+    def data(self):
+        # StageItem view of the columns, built on first access for code that still walks objects
+        if self.stage_items is None:
+            self.stage_items = [StageItem(epoch=Epoch(timestamp=timestamp, index=index), stage=SleepStage(stage))
+                                for timestamp, index, stage in zip(self.timestamps, self.indices, self.stages)]
+        return self.stage_items
+
+    def select(self, mask):
+        return PSGRawDataCollection(subject_id=self.subject_id,
+                                    timestamps=self.timestamps[mask],
+                                    stages=self.stages[mask],
+                                    indices=self.indices[mask])
 
     def get_np_array(self):
-        number_of_epochs = len(self.data)
-        array = np.zeros((number_of_epochs, 2))
-
-        for index in range(number_of_epochs):
-            stage_item = self.data[index]
-            array[index, 0] = stage_item.epoch.timestamp
-            array[index, 1] = stage_item.stage.value
-
-        return array
+        return np.column_stack((self.timestamps, self.stages))
 
     def get_interval(self):
-        number_of_epochs = len(self.data)
-        min_timestamp = 1e15
-        max_timestamp = -1
-
-        for index in range(number_of_epochs):
-            stage_item = self.data[index]
-            if stage_item.epoch.timestamp < min_timestamp:
-                min_timestamp = stage_item.epoch.timestamp
-            if stage_item.epoch.timestamp > max_timestamp:
-                max_timestamp = stage_item.epoch.timestamp
-
-        return Interval(start_time=min_timestamp, end_time=max_timestamp)
+        return Interval(start_time=np.amin(self.timestamps), end_time=np.amax(self.timestamps))
@@ -1,5 +1,3 @@
-import docx2txt as docx2txt
-
 from source import utils
 from source.preprocessing.psg.psg_file_type import PSGFileType
 from source.preprocessing.psg.report_summary import ReportSummary
@@ -43,6 +41,8 @@ class PSGReportProcessor(object):
 
     @staticmethod
     def get_summary_from_docx(report_file_path):
+        import docx2txt
+
         report_text = docx2txt.process(report_file_path)
         report_split = report_text.split('DATE: ')
         date = report_split[1].split('\n')[0]
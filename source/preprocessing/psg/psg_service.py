@@ -5,13 +5,11 @@ import pandas as pd
 
 from source import utils
 from source.constants import Constants
-from source.preprocessing.epoch import Epoch
 from source.preprocessing.psg.compumedics_processor import CompumedicsProcessor
 from source.preprocessing.psg.psg_converter import PSGConverter
 from source.preprocessing.psg.psg_file_type import PSGFileType
 from source.preprocessing.psg.psg_raw_data_collection import PSGRawDataCollection
 from source.preprocessing.psg.psg_report_processor import PSGReportProcessor
-from source.preprocessing.psg.stage_item import StageItem
 from source.preprocessing.psg.vitaport_processor import VitaportProcessor
 
 
@@ -59,63 +57,50 @@ class PSGService(object):
 
     @staticmethod
     def get_original_start_time(subject_id, data_path):
-        psg_path = str(utils.get_project_root().joinpath(data_path + '/labels/' + subject_id + '_labeled_sleep.npy'))
+        psg_path = str(PSGService.get_precleaned_file_path(subject_id, data_path))
         raw_data = np.load(psg_path, mmap_mode='r')
         return raw_data[0, 0]
 
+    @staticmethod
+    def get_precleaned_file_path(subject_id, data_path):
+        return utils.get_project_root().joinpath(data_path + '/labels/' + subject_id + '_labeled_sleep.npy')
+
     @staticmethod
     def read_precleaned(subject_id, data_path):
-        psg_path = str(utils.get_project_root().joinpath(data_path + '/labels/' + subject_id + '_labeled_sleep.npy'))
-        data = []
+        psg_path = str(PSGService.get_precleaned_file_path(subject_id, data_path))
 
         raw_data = np.load(psg_path)
 
-        for i in range(len(raw_data)):
-            timestamp = raw_data[i, 0]
-            score = int(raw_data[i, 1])
-            epoch = Epoch(timestamp=timestamp, index=i + 1)
-            data.append(StageItem(epoch=epoch, stage=PSGConverter.get_label_from_int(score)))
-
-        return PSGRawDataCollection(subject_id=subject_id, data=data)
+        return PSGRawDataCollection(subject_id=subject_id,
+                                    timestamps=raw_data[:, 0],
+                                    stages=PSGConverter.get_values_from_ints(raw_data[:, 1]),
+                                    indices=np.arange(1, np.shape(raw_data)[0] + 1))
 
     @staticmethod
     def crop(psg_raw_collection, interval):
-        subject_id = psg_raw_collection.subject_id
-
-        stage_items = []
-        for stage_item in psg_raw_collection.data:
-            timestamp = stage_item.epoch.timestamp
-            if interval.start_time <= timestamp < interval.end_time:
-                stage_items.append(stage_item)
+        timestamps = psg_raw_collection.timestamps
+        valid_mask = (timestamps >= interval.start_time) & (timestamps < interval.end_time)
 
-        return PSGRawDataCollection(subject_id=subject_id, data=stage_items)
+        return psg_raw_collection.select(valid_mask)
 
     @staticmethod
     def write(psg_raw_data_collection):
-        data_array = []
+        psg_output_path = PSGService.get_cropped_file_path(psg_raw_data_collection.subject_id)
+        np.save(psg_output_path, psg_raw_data_collection.get_np_array())
 
-        for index in range(len(psg_raw_data_collection.data)):
-            stage_item = psg_raw_data_collection.data[index]
-            data_array.append([stage_item.epoch.timestamp, stage_item.stage.value])
-
-        np_psg_array = np.array(data_array)
-        psg_output_path = Constants.CROPPED_FILE_PATH.joinpath(psg_raw_data_collection.subject_id + "_cleaned_psg.npy")
-
-        np.save(psg_output_path, np_psg_array)
+    @staticmethod
+    def get_cropped_file_path(subject_id):
+        return Constants.CROPPED_FILE_PATH.joinpath(subject_id + "_cleaned_psg.npy")
 
     @staticmethod
     def load_cropped_array(subject_id):
-        cropped_psg_path = Constants.CROPPED_FILE_PATH.joinpath(subject_id + "_cleaned_psg.npy")
+        cropped_psg_path = PSGService.get_cropped_file_path(subject_id)
         return np.load(str(cropped_psg_path))
 
     @staticmethod
     def load_cropped(subject_id):
         cropped_array = PSGService.load_cropped_array(subject_id)
-        stage_items = []
-
-        for row in range(np.shape(cropped_array)[0]):
-            value = cropped_array[row, 1]
-            stage_items.append(StageItem(epoch=Epoch(timestamp=cropped_array[row, 0], index=row),
-                                         stage=PSGConverter.get_label_from_int(value)))
 
-        return PSGRawDataCollection(subject_id=subject_id, data=stage_items)
+        return PSGRawDataCollection(subject_id=subject_id,
+                                    timestamps=cropped_array[:, 0],
+                                    stages=PSGConverter.get_values_from_ints(cropped_array[:, 1]))
@@ -1,13 +1,17 @@
 import numpy as np
 
 from source import utils
+from source.constants import Constants
 from source.preprocessing.activity_count.activity_count_service import ActivityCountService
 from source.preprocessing.epoch import Epoch
+from source.preprocessing.epoch_array import EpochArray
 from source.preprocessing.heart_rate.heart_rate_service import HeartRateService
 from source.preprocessing.interval import Interval
 from source.preprocessing.motion.motion_service import MotionService
 from source.preprocessing.psg.psg_service import PSGService
 from source.sleep_stage import SleepStage
+from source.tracing.memory_profiler import MemoryProfiler
+from source.tracing.tracer import Tracer
 
 
 class RawDataProcessor:
@@ -15,9 +19,16 @@ class RawDataProcessor:
 
     @staticmethod
     def crop_all(subject_id, data_path):
+        with Tracer.span('crop_all'):
+            RawDataProcessor.crop(subject_id, data_path)
+            RawDataProcessor.build_activity_counts(subject_id)
+
+    @staticmethod
+    def crop(subject_id, data_path):
         # psg_raw_collection = PSGService.read_raw(subject_id)       # Used to extract PSG details from the reports
-        psg_raw_collection = PSGService.read_precleaned(subject_id, data_path)  # Loads already extracted PSG data
-        motion_collection = MotionService.load_raw(subject_id, data_path)
+        with Tracer.span('load_raw', source='psg'):
+            psg_raw_collection = PSGService.read_precleaned(subject_id, data_path)  # Loads already extracted PSG data
+        motion_collection = MotionService.load_raw(subject_id, data_path, columns=MotionService.COUNT_COLUMNS)
         heart_rate_collection = HeartRateService.load_raw(subject_id, data_path)
 
         valid_interval = RawDataProcessor.get_intersecting_interval([psg_raw_collection,
@@ -28,10 +39,22 @@ class RawDataProcessor:
         motion_collection = MotionService.crop(motion_collection, valid_interval)
         heart_rate_collection = HeartRateService.crop(heart_rate_collection, valid_interval)
 
-        PSGService.write(psg_raw_collection)
-        MotionService.write(motion_collection)
-        HeartRateService.write(heart_rate_collection)
-        ActivityCountService.build_activity_counts_without_matlab(subject_id, motion_collection.data)  # Builds activity counts with python, not MATLAB
+        with Tracer.span('write_cropped', motion_shape=np.shape(motion_collection.data),
+                         heart_rate_shape=np.shape(heart_rate_collection.data)):
+            PSGService.write(psg_raw_collection)
+            MotionService.write(motion_collection)
+            HeartRateService.write(heart_rate_collection)
+
+    @staticmethod
+    def build_activity_counts(subject_id):
+        motion_collection = MotionService.load_cropped(subject_id)
+        with Tracer.span('build_activity_counts', samples=np.shape(motion_collection.data)[0],
+                         incremental=Constants.INCREMENTAL_ACTIVITY_COUNTS), \
+                MemoryProfiler.stage('build_activity_counts', samples=np.shape(motion_collection.data)[0]):
+            if Constants.INCREMENTAL_ACTIVITY_COUNTS:
+                ActivityCountService.build_activity_counts_incrementally(subject_id, motion_collection.data)
+            else:
+                ActivityCountService.build_activity_counts_without_matlab(subject_id, motion_collection.data)  # Builds activity counts with python, not MATLAB
 
     @staticmethod
     def get_intersecting_interval(collection_list):
@@ -46,35 +69,29 @@ class RawDataProcessor:
 
     @staticmethod
     def get_valid_epochs(subject_id):
+        with Tracer.span('get_valid_epochs') as span, MemoryProfiler.stage('get_valid_epochs'):
+            valid_epochs = RawDataProcessor.build_valid_epochs(subject_id)
+            span.set('epochs', len(valid_epochs))
+            return valid_epochs
 
+    @staticmethod
+    def build_valid_epochs(subject_id):
         psg_collection = PSGService.load_cropped(subject_id)
         motion_collection = MotionService.load_cropped(subject_id)
         heart_rate_collection = HeartRateService.load_cropped(subject_id)
 
-        start_time = psg_collection.data[0].epoch.timestamp
-        motion_epoch_dictionary = RawDataProcessor.get_valid_epoch_dictionary(motion_collection.timestamps,
-                                                                              start_time)
-        hr_epoch_dictionary = RawDataProcessor.get_valid_epoch_dictionary(heart_rate_collection.timestamps,
-                                                                          start_time)
-
-        valid_epochs = []
-        for stage_item in psg_collection.data:
-            epoch = stage_item.epoch
+        epoch_timestamps = psg_collection.timestamps
+        start_time = epoch_timestamps[0]
 
-            if epoch.timestamp in motion_epoch_dictionary and epoch.timestamp in hr_epoch_dictionary \
-                    and stage_item.stage != SleepStage.unscored:
-                valid_epochs.append(epoch)
+        valid_mask = RawDataProcessor.get_valid_epoch_mask(motion_collection.timestamps, start_time,
+                                                           epoch_timestamps) \
+            & RawDataProcessor.get_valid_epoch_mask(heart_rate_collection.timestamps, start_time,
+                                                    epoch_timestamps) \
+            & (psg_collection.stages != SleepStage.unscored.value)
 
-        return valid_epochs
+        return EpochArray(timestamps=epoch_timestamps[valid_mask], indices=psg_collection.indices[valid_mask])
 
     @staticmethod
-    def get_valid_epoch_dictionary(timestamps, start_time):
-        epoch_dictionary = {}
-
-        for ind in range(np.shape(timestamps)[0]):
-            time = timestamps[ind]
-            floored_timestamp = time - np.mod(time - start_time, Epoch.DURATION)
-
-            epoch_dictionary[floored_timestamp] = True
-
-        return epoch_dictionary
+    def get_valid_epoch_mask(timestamps, start_time, epoch_timestamps):
+        floored_timestamps = timestamps - np.mod(timestamps - start_time, Epoch.DURATION)
+        return np.isin(epoch_timestamps, np.unique(floored_timestamps))
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+from source.constants import Constants
+
+
+class StageCache(object):
+    # Remembers, per session, the key each pipeline stage last completed with. A key hashes the contents of the
+    # stage's input files together with its parameters, so a stage can be skipped when neither has changed.
+    VERSION = 1  # Bump when a stage's code changes in a way that should invalidate stored artifacts
+    READ_SIZE = 1 << 20
+
+    CROP = 'crop'
+    COUNTS = 'counts'
+    FEATURES = 'features'
+    PREDICTIONS = 'predictions'
+
+    def __init__(self, manifest_path):
+        self.manifest_path = str(manifest_path)
+        self.manifest = {'stages': {}, 'digests': {}}
+
+        if os.path.exists(self.manifest_path):
+            try:
+                with open(self.manifest_path, 'r') as file:
+                    self.manifest = json.load(file)
+            except ValueError:
+                print(f"Ignoring unreadable stage cache at {self.manifest_path}")
+
+    @staticmethod
+    def get_manifest_path(data_path, subject_id):
+        return os.path.join(data_path, 'outputs', subject_id + '_stage_cache.json')
+
+    def get_key(self, stage, input_paths, parameters):
+        key = hashlib.sha256()
+        key.update(json.dumps([StageCache.VERSION, stage, parameters], sort_keys=True, default=str).encode('utf-8'))
+        for input_path in input_paths:
+            key.update(self.get_file_digest(input_path).encode('utf-8'))
+        return key.hexdigest()
+
+    def get_file_digest(self, path):
+        path = str(path)
+        if not os.path.exists(path):
+            return 'missing:' + path
+
+        # Contents are only rehashed when the size or modification time moves
+        status = os.stat(path)
+        stamp = [status.st_size, status.st_mtime_ns]
+        known = self.manifest['digests'].get(path)
+        if known is not None and known[:2] == stamp:
+            return known[2]
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(StageCache.READ_SIZE), b''):
+                digest.update(block)
+
+        self.manifest['digests'][path] = stamp + [digest.hexdigest()]
+        return digest.hexdigest()
+
+    def is_current(self, stage, key, output_paths=()):
+        if not Constants.SKIP_UNCHANGED_STAGES:
+            return False
+        if self.manifest['stages'].get(stage) != key:
+            return False
+        return all(os.path.exists(str(output_path)) for output_path in output_paths)
+
+    def record(self, stage, key):
+        self.manifest['stages'][stage] = key
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_path) or '.', exist_ok=True)
+        temporary_path = self.manifest_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.manifest, file)
+        os.replace(temporary_path, self.manifest_path)
@@ -0,0 +1,34 @@
+import json
+
+
+class MemoryProfile(object):
+    def __init__(self):
+        self.stages = []
+        self.stack = []
+        self.next_id = 1
+
+    def get_next_id(self):
+        stage_id = self.next_id
+        self.next_id += 1
+        return stage_id
+
+    def add(self, record):
+        self.stages.append(record)
+
+    def get_stages(self, name=None):
+        stages = sorted(self.stages, key=lambda stage: stage['id'])
+        if name is None:
+            return stages
+        return [stage for stage in stages if stage['name'] == name]
+
+    def get_largest(self, key='peak_increase_bytes'):
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda stage: stage[key])
+
+    def write_json(self, path):
+        largest = self.get_largest()
+        report = {'largest_stage': largest['name'] if largest is not None else None,
+                  'stages': self.get_stages()}
+        with open(str(path), 'w') as file:
+            json.dump(report, file, indent=2, default=str)
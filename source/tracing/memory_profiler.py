@@ -0,0 +1,44 @@
+import tracemalloc
+
+from source.tracing.memory_profile import MemoryProfile
+from source.tracing.memory_stage import MemoryStage
+from source.tracing.span import NullSpan
+
+
+class MemoryProfiler(object):
+    # Opt-in allocation tracking around pipeline stages. tracemalloc slows allocation-heavy code several times over,
+    # so it only runs between start() and stop(); otherwise stage() returns a shared no-op.
+    TRACEBACK_FRAMES = 1
+    TOP_ALLOCATIONS = 10
+
+    profile = None
+    started_tracemalloc = False
+    null_stage = NullSpan()
+
+    @staticmethod
+    def start():
+        MemoryProfiler.started_tracemalloc = not tracemalloc.is_tracing()
+        if MemoryProfiler.started_tracemalloc:
+            tracemalloc.start(MemoryProfiler.TRACEBACK_FRAMES)
+        MemoryProfiler.profile = MemoryProfile()
+        return MemoryProfiler.profile
+
+    @staticmethod
+    def stop():
+        profile = MemoryProfiler.profile
+        MemoryProfiler.profile = None
+        if MemoryProfiler.started_tracemalloc:
+            tracemalloc.stop()
+            MemoryProfiler.started_tracemalloc = False
+        return profile
+
+    @staticmethod
+    def is_enabled():
+        return MemoryProfiler.profile is not None
+
+    @staticmethod
+    def stage(name, **attributes):
+        profile = MemoryProfiler.profile
+        if profile is None:
+            return MemoryProfiler.null_stage
+        return MemoryStage(profile, name, attributes, MemoryProfiler.TOP_ALLOCATIONS)
@@ -0,0 +1,93 @@
+import os
+import tracemalloc
+
+
+class MemoryStage(object):
+    # Peaks of nested stages are folded into their parent, since tracemalloc keeps a single process-wide peak that
+    # each stage resets on entry
+    def __init__(self, profile, name, attributes, top_allocations):
+        self.profile = profile
+        self.name = name
+        self.attributes = attributes
+        self.top_allocations = top_allocations
+        self.stage_id = None
+        self.parent = None
+        self.peak_so_far = 0
+        self.traced_before = 0
+        self.rss_before = 0
+        self.max_rss_before = 0
+        self.snapshot_before = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.stage_id = self.profile.get_next_id()
+        self.parent = self.profile.stack[-1] if self.profile.stack else None
+        if self.parent is not None:
+            self.parent.peak_so_far = max(self.parent.peak_so_far, tracemalloc.get_traced_memory()[1])
+        self.profile.stack.append(self)
+
+        self.rss_before = MemoryStage.get_rss()
+        self.max_rss_before = MemoryStage.get_max_rss()
+        self.snapshot_before = MemoryStage.take_snapshot() if self.top_allocations > 0 else None
+        tracemalloc.reset_peak()
+        self.traced_before = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        traced_after, traced_peak = tracemalloc.get_traced_memory()
+        peak = max(self.peak_so_far, traced_peak)
+        self.profile.stack.pop()
+        if self.parent is not None:
+            self.parent.peak_so_far = max(self.parent.peak_so_far, peak)
+
+        top_allocations = []
+        if self.snapshot_before is not None:
+            # Sites whose live allocations grew the most between entering and leaving the stage
+            differences = MemoryStage.take_snapshot().compare_to(self.snapshot_before, 'lineno')
+            for difference in differences[:self.top_allocations]:
+                frame = difference.traceback[0]
+                top_allocations.append({'site': frame.filename + ':' + str(frame.lineno),
+                                        'size_increase_bytes': difference.size_diff,
+                                        'count_increase': difference.count_diff})
+
+        rss_after = MemoryStage.get_rss()
+        record = {'id': self.stage_id,
+                  'name': self.name,
+                  'parent': self.parent.stage_id if self.parent is not None else None,
+                  'depth': len(self.profile.stack),
+                  'peak_bytes': peak,
+                  'peak_increase_bytes': peak - self.traced_before,
+                  'retained_bytes': traced_after - self.traced_before,
+                  'rss_before_bytes': self.rss_before,
+                  'rss_after_bytes': rss_after,
+                  'rss_delta_bytes': rss_after - self.rss_before,
+                  'max_rss_delta_bytes': MemoryStage.get_max_rss() - self.max_rss_before,
+                  'top_allocations': top_allocations}
+        if exception_type is not None:
+            record['error'] = exception_type.__name__
+        record.update(self.attributes)
+        self.profile.add(record)
+        return False
+
+    @staticmethod
+    def take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                                          tracemalloc.Filter(False, __file__)])
+
+    @staticmethod
+    def get_rss():
+        try:
+            with open('/proc/self/statm') as file:
+                return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def get_max_rss():
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Reported in KiB on Linux
+        except ImportError:
+            return 0
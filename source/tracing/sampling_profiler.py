@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from source import utils
+
+
+class SamplingProfiler(object):
+    # Samples Python stacks from a background thread at a fixed interval, so the profiled code runs uninstrumented.
+    # The profiled thread is sampled along with every thread started while profiling, such as the feature builder's
+    # pool workers; each stack is rooted at its thread's name. Output is the collapsed-stack format
+    # ("thread;outer;inner;leaf count" per line) that flamegraph.pl, speedscope and inferno read.
+    DEFAULT_INTERVAL_IN_SECONDS = 0.005
+    MAXIMUM_DEPTH = 128
+
+    def __init__(self, interval=DEFAULT_INTERVAL_IN_SECONDS, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = Counter()
+        self.sample_count = 0
+        self.elapsed_seconds = 0
+        self.running = False
+        self.sampler = None
+        self.start_time = None
+        self.existing_thread_ids = set()
+        self.project_root = str(utils.get_project_root()) + os.sep
+
+    def __enter__(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        # Threads already running (the server's, the model poller, ...) have nothing to do with the profiled work
+        self.existing_thread_ids = set(sys._current_frames()) - {self.thread_id}
+        self.running = True
+        self.start_time = time.perf_counter()
+        self.sampler = threading.Thread(target=self.sample, name='sampling-profiler', daemon=True)
+        self.sampler.start()
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        self.running = False
+        self.sampler.join()
+        self.elapsed_seconds = time.perf_counter() - self.start_time
+        return False
+
+    def sample(self):
+        sampler_thread_id = threading.get_ident()
+        while self.running:
+            frames = sys._current_frames()
+            if self.thread_id in frames:
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, frame in frames.items():
+                    if thread_id != sampler_thread_id and thread_id not in self.existing_thread_ids:
+                        self.samples[self.collapse(thread_names.get(thread_id, str(thread_id)), frame)] += 1
+                self.sample_count += 1
+            time.sleep(self.interval)
+
+    def collapse(self, thread_name, frame):
+        names = []
+        while frame is not None and len(names) < SamplingProfiler.MAXIMUM_DEPTH:
+            names.append(self.get_frame_name(frame))
+            frame = frame.f_back
+        names.append(thread_name.replace(';', ':'))
+        return ';'.join(reversed(names))
+
+    def get_frame_name(self, frame):
+        code = frame.f_code
+        filename = code.co_filename
+        if filename.startswith(self.project_root):
+            filename = filename[len(self.project_root):]
+        else:
+            filename = os.path.basename(filename)
+
+        # Semicolons separate frames in the collapsed format
+        name = code.co_qualname if hasattr(code, 'co_qualname') else code.co_name
+        return (name + ' (' + filename + ':' + str(code.co_firstlineno) + ')').replace(';', ':')
+
+    def get_collapsed(self):
+        lines = [stack + ' ' + str(count) for stack, count in sorted(self.samples.items())]
+        return '\n'.join(lines) + ('\n' if lines else '')
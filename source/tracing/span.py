@@ -0,0 +1,56 @@
+import threading
+import time
+
+
+class Span(object):
+    def __init__(self, tracer, trace, name, parent, attributes):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.span_id = None
+        self.wall_start = None
+        self.cpu_start = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.span_id = self.trace.get_next_id()
+        self.tracer.push(self)
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        wall_seconds = time.perf_counter() - self.wall_start
+        cpu_seconds = time.thread_time() - self.cpu_start
+        self.tracer.pop(self)
+
+        record = {'id': self.span_id,
+                  'parent': self.parent.span_id if self.parent is not None else None,
+                  'name': self.name,
+                  'thread': threading.current_thread().name,
+                  'start': self.wall_start - self.trace.start_time,
+                  'wall_seconds': wall_seconds,
+                  'cpu_seconds': cpu_seconds}
+        if exception_type is not None:
+            record['error'] = exception_type.__name__
+        record.update(self.attributes)
+        self.trace.add(record)
+        return False
+
+
+class NullSpan(object):
+    # Returned while tracing is off so instrumented code pays for one attribute check and nothing else
+    span_id = None
+
+    def set(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, exception_traceback):
+        return False
@@ -0,0 +1,34 @@
+import itertools
+import json
+import threading
+import time
+
+
+class Trace(object):
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.spans = []
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def get_next_id(self):
+        with self.lock:
+            return next(self.ids)
+
+    def add(self, record):
+        with self.lock:
+            self.spans.append(record)
+
+    def get_spans(self, name=None):
+        spans = sorted(self.spans, key=lambda span: span['start'])
+        if name is None:
+            return spans
+        return [span for span in spans if span['name'] == name]
+
+    def get_total_seconds(self, name):
+        return sum(span['wall_seconds'] for span in self.get_spans(name))
+
+    def write_json_lines(self, path):
+        with open(str(path), 'w') as file:
+            for span in self.get_spans():
+                file.write(json.dumps(span, default=str) + '\n')
@@ -0,0 +1,57 @@
+import threading
+
+from source.tracing.span import NullSpan, Span
+from source.tracing.trace import Trace
+
+
+class Tracer(object):
+    # Process-wide switch for stage tracing. While no trace is active, span() hands back a shared no-op span.
+    # Parents are tracked per thread; work handed to another thread passes parent=Tracer.current() explicitly.
+    trace = None
+    null_span = NullSpan()
+    local = threading.local()
+
+    @staticmethod
+    def start():
+        Tracer.trace = Trace()
+        return Tracer.trace
+
+    @staticmethod
+    def stop():
+        trace = Tracer.trace
+        Tracer.trace = None
+        return trace
+
+    @staticmethod
+    def is_enabled():
+        return Tracer.trace is not None
+
+    @staticmethod
+    def span(name, parent=None, **attributes):
+        trace = Tracer.trace
+        if trace is None:
+            return Tracer.null_span
+        if parent is None:
+            parent = Tracer.current()
+        elif isinstance(parent, NullSpan):
+            parent = None
+        return Span(Tracer, trace, name, parent, attributes)
+
+    @staticmethod
+    def current():
+        stack = getattr(Tracer.local, 'stack', None)
+        if not stack:
+            return None
+        return stack[-1]
+
+    @staticmethod
+    def push(span):
+        if not hasattr(Tracer.local, 'stack'):
+            Tracer.local.stack = []
+        Tracer.local.stack.append(span)
+
+    @staticmethod
+    def pop(span):
+        stack = Tracer.local.stack
+        if stack and stack[-1] is span:
+            stack.pop()
@@ -2,17 +2,11 @@ from io import StringIO
 from pathlib import Path
 
 import numpy as np
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.pdfpage import PDFPage
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.linear_model import LogisticRegression
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.neural_network import MLPClassifier
 
 from source.analysis.setup.attributed_classifier import AttributedClassifier
 from source.analysis.setup.feature_type import FeatureType
+from source.tracing.memory_profiler import MemoryProfiler
+from source.tracing.tracer import Tracer
 
 
 def get_project_root() -> Path:
@@ -20,14 +14,19 @@ def get_project_root() -> Path:
 
 
 def get_classifiers():
+    # Training-only, so scikit-learn's estimators stay out of the webhook's imports
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.neural_network import MLPClassifier
+
     return [AttributedClassifier(name='Random Forest',
                                  classifier=RandomForestClassifier(n_estimators=100, max_features=1.0,
                                                                    max_depth=10,
                                                                    min_samples_split=10, min_samples_leaf=32,
                                                                    bootstrap=True)),
             AttributedClassifier(name='Logistic Regression',
-                                 classifier=LogisticRegression(penalty='l1', solver='liblinear', verbose=0,
-                                                               multi_class='auto')),
+                                 classifier=LogisticRegression(penalty='l1', solver='liblinear', verbose=0)),
             AttributedClassifier(name='k-Nearest Neighbors',
                                  classifier=KNeighborsClassifier(weights='distance')),
             AttributedClassifier(name='Neural Net',
@@ -46,6 +45,11 @@ def get_base_feature_sets():
 
 
 def convert_pdf_to_txt(pdf_path_string, all_texts):
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.pdfpage import PDFPage
+
     resource_manager = PDFResourceManager()
     returned_string = StringIO()
     codec = 'utf-8'
@@ -102,6 +106,27 @@ def smooth_gauss_causal(y, box_pts):
     return sum_value
 
 
+def gauss_causal_weights(box_pts):
+    mu = box_pts - 1
+    sigma = 50  # seconds
+
+    box = np.exp(-1 / 2 * (((np.arange(box_pts) - mu) / sigma) ** 2))
+    return box / np.sum(box)
+
+
+def apply_to_windows(values, starts, ends, function):
+    # Windows of equal length are stacked into a matrix so function runs once per distinct length
+    output = np.zeros(np.shape(starts)[0], dtype=values.dtype)
+    lengths = ends - starts
+
+    for length in np.unique(lengths):
+        rows = np.nonzero(lengths == length)[0]
+        windows = values[starts[rows, np.newaxis] + np.arange(length)]
+        output[rows] = function(windows)
+
+    return output
+
+
 def convolve_with_dog(y, box_pts):
     y = y - np.mean(y)
     box = np.ones(box_pts) / box_pts
@@ -120,7 +145,7 @@ def convolve_with_dog(y, box_pts):
 
     y = np.insert(y, 0, np.flip(y[0:int(box_pts / 2)]))  # Pad by repeating boundary conditions
     y = np.insert(y, len(y) - 1, np.flip(y[int(-box_pts / 2):]))
-    y_smooth = np.convolve(y, box, mode='valid')
+    y_smooth = np.convolve(y, box.astype(y.dtype, copy=False), mode='valid')
 
     return y_smooth
 
@@ -131,6 +156,77 @@ def remove_repeats(array):
     return array_no_repeats
 
 
+def remove_repeats_from_columns(array, columns):
+    # Same rows as remove_repeats, restricted to columns. When timestamps are already strictly increasing only the
+    # timestamp column is read, so other columns of a memory-mapped array never leave the page cache. Otherwise
+    # repeats are found from the timestamps and a hash of each row, so only the kept rows of columns are gathered.
+    with Tracer.span('remove_repeats', rows=np.shape(array)[0]) as span, MemoryProfiler.stage('remove_repeats'):
+        timestamps = array[:, 0]
+        if np.all(timestamps[1:] > timestamps[:-1]):
+            return array[:, columns]
+
+        rows = get_unique_row_indices(array)
+        if rows is None:
+            array = remove_repeats(np.asarray(array))[:, columns]  # Two different rows hashed alike
+        else:
+            array = np.column_stack([array[:, column][rows] for column in columns])
+        span.set('rows_kept', np.shape(array)[0])
+        return array
+
+
+def get_row_hashes(array, block_rows=1 << 16):
+    # 64-bit hash of each row's values, read a block of rows at a time. Adding 0.0 turns -0.0 into 0.0, which
+    # np.unique counts as equal.
+    hashes = np.empty(np.shape(array)[0], dtype=np.uint64)
+    for block_start in range(0, np.shape(array)[0], block_rows):
+        block = array[block_start:block_start + block_rows]
+        block_hashes = np.zeros(np.shape(block)[0], dtype=np.uint64)
+        for column in range(np.shape(block)[1]):
+            block_hashes ^= (np.asarray(block[:, column], dtype=np.float64) + 0.0).view(np.uint64)
+            # splitmix64 finalizer, so every bit of every column reaches every bit of the hash
+            block_hashes ^= block_hashes >> np.uint64(30)
+            block_hashes *= np.uint64(0xbf58476d1ce4e5b9)
+            block_hashes ^= block_hashes >> np.uint64(27)
+            block_hashes *= np.uint64(0x94d049bb133111eb)
+            block_hashes ^= block_hashes >> np.uint64(31)
+        hashes[block_start:block_start + np.shape(block)[0]] = block_hashes
+    return hashes
+
+
+def get_unique_row_indices(array):
+    # Indices of the distinct rows of array in the order remove_repeats returns them: by timestamp, then by the
+    # remaining columns for the rare distinct rows sharing a timestamp. None if two different rows hash alike.
+    timestamps = array[:, 0]
+    hashes = get_row_hashes(array)
+    order = np.lexsort((hashes, timestamps))
+    sorted_timestamps = timestamps[order]
+    is_first = np.ones(np.shape(order)[0], dtype=bool)
+    is_first[1:] = sorted_timestamps[1:] != sorted_timestamps[:-1]
+    hashes = hashes[order]
+    is_first[1:] |= hashes[1:] != hashes[:-1]
+    del hashes
+
+    # Each dropped row is compared with the kept row before it, column by column
+    first_positions = np.maximum.accumulate(np.where(is_first, np.arange(np.shape(order)[0]), 0))
+    dropped_rows = order[~is_first]
+    kept_rows = order[first_positions[~is_first]]
+    for column in range(np.shape(array)[1]):
+        if not np.array_equal(array[:, column][dropped_rows], array[:, column][kept_rows]):
+            return None
+
+    rows = order[is_first]
+    kept_timestamps = sorted_timestamps[is_first]
+    shares_timestamp = kept_timestamps[1:] == kept_timestamps[:-1]
+    is_tied = np.zeros(np.shape(rows)[0], dtype=bool)
+    is_tied[1:] |= shares_timestamp
+    is_tied[:-1] |= shares_timestamp
+    if np.any(is_tied):
+        tied_positions = np.flatnonzero(is_tied)
+        tied_rows = np.asarray(array[rows[tied_positions]])
+        rows[tied_positions] = rows[tied_positions][np.lexsort(tied_rows.T[::-1])]
+    return rows
+
+
 def remove_nans(array):
     array = array[~np.isnan(array).any(axis=1)]
     array = array[~np.isinf(array).any(axis=1)]
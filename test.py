@@ -1,3 +1,4 @@
 import numpy as np
-x = np.load('outputs/features/893_count_feature.npy')
-np.savetxt('test.out', x)
\ No newline at end of file
+from source.preprocessing.feature_store import FeatureStore
+x = FeatureStore.read(FeatureStore.get_path('893'), columns=[FeatureStore.COUNT])[FeatureStore.COUNT]
+np.savetxt('test.out', x)
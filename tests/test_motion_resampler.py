@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from source.constants import Constants
+from source.preprocessing.activity_count.activity_count_service import ActivityCountService
+from source.preprocessing.motion.motion_resampler import MotionResampler
+from source.preprocessing.motion.resampling_mode import ResamplingMode
+
+
+@pytest.mark.parametrize('native_rate, mode', [(50, ResamplingMode.uniform), (32, ResamplingMode.polyphase)])
+def test_count_length_matches_interpolation(native_rate, mode, monkeypatch):
+    monkeypatch.setattr(Constants, 'VERBOSE', False)
+    fs = ActivityCountService.SAMPLING_FREQUENCY
+    timestamps = np.arange(0, 2 * 3600, 1.0 / native_rate)
+    z_values = np.random.default_rng(0).standard_normal(np.shape(timestamps)[0])
+    assert MotionResampler(timestamps, z_values, fs).mode == mode
+
+    # One sample pushed half a period off its slot is enough to fall back to interpolation
+    jittered_timestamps = timestamps.copy()
+    jittered_timestamps[1000] += 0.5 / native_rate
+    assert MotionResampler(jittered_timestamps, z_values, fs).mode == ResamplingMode.interpolate
+
+    counts = ActivityCountService.build_counts(timestamps, z_values)
+    interpolated_counts = ActivityCountService.build_counts(jittered_timestamps, z_values)
+    assert np.shape(counts) == np.shape(interpolated_counts)
+    assert np.shape(counts)[0] == np.shape(np.arange(timestamps[0], timestamps[-1], 1.0 / fs))[0] // (fs * 15)
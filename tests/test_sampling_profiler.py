@@ -0,0 +1,24 @@
+from source.benchmarks.synthetic_night_generator import SyntheticNightGenerator
+from source.constants import Constants
+from source.preprocessing.preprocessing_runner import PreprocessingRunner
+from source.tracing.sampling_profiler import SamplingProfiler
+
+FEATURE_SERVICES = ['activity_count_feature_service', 'heart_rate_feature_service', 'time_based_feature_service']
+
+
+def test_feature_services_on_pool_threads_are_sampled(tmp_path, monkeypatch):
+    # run_preprocessing points these at the session, so they are restored afterwards
+    for name in ['VERBOSE', 'SKIP_UNCHANGED_STAGES', 'CROPPED_FILE_PATH', 'FEATURE_FILE_PATH']:
+        monkeypatch.setattr(Constants, name, getattr(Constants, name))
+    Constants.update('VERBOSE', False)
+    Constants.update('SKIP_UNCHANGED_STAGES', False)
+
+    session_dir = str(tmp_path)
+    SyntheticNightGenerator.generate(session_dir, hours=8)
+    with SamplingProfiler(0.001) as profiler:
+        PreprocessingRunner.run_preprocessing(SyntheticNightGenerator.SUBJECT_ID, session_dir)
+
+    stacks = [line.rsplit(' ', 1)[0] for line in profiler.get_collapsed().splitlines()]
+    feature_stacks = [stack for stack in stacks if any(service in stack for service in FEATURE_SERVICES)]
+    assert feature_stacks
+    assert all(stack.startswith('feature-builder') for stack in feature_stacks)